@@ -84,11 +84,14 @@ def delete_marker():
 def load_from_excel():
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
     if file_path:
+        global df
         excel_df = pd.read_excel(file_path)
-        for index, row in excel_df.iterrows():
-            df.loc[len(df)] = [row['Latitude'], row['Longitude'], row['Label'], row['Color']]
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']}")
+        # Append the whole sheet in one concat and fill the list in one call
+        new_rows = excel_df[['Latitude', 'Longitude', 'Label', 'Color']]
+        df = pd.concat([df, new_rows], ignore_index=True)
+        coordinates_listbox.insert(tk.END, *[f"{label} ({lat}, {lon}) - {color}" for lat, lon, label, color in
+                                             zip(new_rows['Latitude'], new_rows['Longitude'], new_rows['Label'],
+                                                 new_rows['Color'])])
 
 
 # Function to pick a color
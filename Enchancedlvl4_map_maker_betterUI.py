@@ -92,12 +92,16 @@ def delete_marker():
 def load_from_excel():
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
     if file_path:
+        global df
         excel_df = pd.read_excel(file_path)
-        for index, row in excel_df.iterrows():
-            df.loc[len(df)] = [row['Latitude'], row['Longitude'], row['Label'], row['Color'],
-                               row.get('Icon', 'info-sign')]
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row.get('Icon', 'info-sign')}")
+        # Fill the default icon column-wise, append the whole sheet in one concat and fill the list in one call
+        if 'Icon' not in excel_df.columns:
+            excel_df['Icon'] = 'info-sign'
+        new_rows = excel_df[['Latitude', 'Longitude', 'Label', 'Color', 'Icon']].fillna({'Icon': 'info-sign'})
+        df = pd.concat([df, new_rows], ignore_index=True)
+        coordinates_listbox.insert(tk.END, *[f"{label} ({lat}, {lon}) - {color} - {icon}" for lat, lon, label, color, icon in
+                                             zip(new_rows['Latitude'], new_rows['Longitude'], new_rows['Label'],
+                                                 new_rows['Color'], new_rows['Icon'])])
 
 
 # Function to save project to a CSV file
@@ -5,16 +5,23 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, colorchooser
 from PIL import ImageTk, Image
 import io
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 import os
 import json
+import hashlib
+from pathlib import Path
+from my_map_marker_tool.browser_pool import BrowserPool
+from my_map_marker_tool.workers import JobRunner
+from my_map_marker_tool.marker_store import MarkerStore
+from my_map_marker_tool.renderers import GeoJsonMarkers, IconTable, SharedIconMarker
 
 output_map_file = 'marked_map.html'
 
 # Initialize the DataFrame to hold marker data
 df = pd.DataFrame(columns=['Latitude', 'Longitude', 'Label', 'Color', 'Icon'])
+# Fingerprint of the markers and settings output_map_file was last built from
+rendered_fingerprint = None
+# Headless Chrome kept running between image exports; quit when the app closes
+browsers = BrowserPool()
 
 
 # Function to add or update a marker
@@ -63,19 +70,49 @@ def create_map():
         messagebox.showerror("Error", "No markers to add to the map")
         return
 
-    initial_location = [df['Latitude'].iloc[0], df['Longitude'].iloc[0]]
-    mymap = folium.Map(location=initial_location, zoom_start=zoom_scale.get(), tiles=map_style.get())
+    start_job("Creating map...", render_map_job, df.copy(), zoom_scale.get(), map_style.get(),
+              cluster_markers.get(), on_done=webbrowser.open)
 
-    for index, row in df.iterrows():
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=row['Label'],
-            icon=folium.Icon(color=row['Color'], icon=row['Icon'])
-        ).add_to(mymap)
 
-    output_map_file = 'marked_map.html'
+# Background job: build the folium map from a copy of the markers and save it
+def render_map_job(job, markers, zoom_start, tiles, cluster=False):
+    global rendered_fingerprint
+    fingerprint = map_fingerprint(markers, zoom_start, tiles, cluster)
+    if fingerprint == rendered_fingerprint and os.path.exists(output_map_file):
+        # Nothing changed since the last map; just open it again
+        return output_map_file
+    rendered_fingerprint = None
+
+    initial_location = [markers['Latitude'].iloc[0], markers['Longitude'].iloc[0]]
+    mymap = folium.Map(location=initial_location, zoom_start=zoom_start, tiles=tiles)
+
+    if cluster:
+        # One clustered layer instead of a DOM element per marker
+        layer = GeoJsonMarkers(cluster=True)
+        layer.add_store(MarkerStore.from_dataframe(markers))
+        layer.add_to(mymap)
+    else:
+        # One icon per (color, icon) pair, shared by the markers; also draws pick_color() hex colors
+        icon_table = IconTable()
+        icon_table.add_to(mymap)
+        styles = icon_table.style_table.codes(MarkerStore.from_dataframe(markers)).tolist()
+        total = len(markers)
+        for (index, row), style in zip(markers.iterrows(), styles):
+            SharedIconMarker([row['Latitude'], row['Longitude']], icon_table, style, label=row['Label']).add_to(mymap)
+            if index % 1000 == 0:
+                job.check_cancelled()
+                job.report(index, total)
+
     mymap.save(output_map_file)
-    webbrowser.open(output_map_file)
+    rendered_fingerprint = fingerprint
+    return output_map_file
+
+
+# Hash of the marker values and the render settings
+def map_fingerprint(markers, zoom_start, tiles, cluster):
+    digest = hashlib.blake2b(json.dumps([zoom_start, tiles, cluster]).encode('utf-8'), digest_size=16)
+    digest.update(pd.util.hash_pandas_object(markers, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
 
 
 # Function to delete a marker
@@ -94,12 +131,29 @@ def delete_marker():
 def load_from_excel():
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
     if file_path:
-        excel_df = pd.read_excel(file_path)
-        for index, row in excel_df.iterrows():
-            df.loc[len(df)] = [row['Latitude'], row['Longitude'], row['Label'], row['Color'],
-                               row.get('Icon', 'info-sign')]
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row.get('Icon', 'info-sign')}")
+        start_job("Loading workbook...", read_excel_job, file_path, on_done=add_loaded_rows)
+
+
+# Background job: read the workbook and fill the default icon column-wise
+def read_excel_job(job, file_path):
+    excel_df = pd.read_excel(file_path)
+    if 'Icon' not in excel_df.columns:
+        excel_df['Icon'] = 'info-sign'
+    return excel_df[['Latitude', 'Longitude', 'Label', 'Color', 'Icon']].fillna({'Icon': 'info-sign'})
+
+
+# Function to append loaded rows in one concat and fill the list in one call (runs on the Tk thread)
+def add_loaded_rows(new_rows):
+    global df
+    df = pd.concat([df, new_rows], ignore_index=True)
+    fill_listbox(new_rows)
+
+
+# Function to append rows to the list in one call
+def fill_listbox(rows):
+    coordinates_listbox.insert(tk.END, *[f"{label} ({lat}, {lon}) - {color} - {icon}" for lat, lon, label, color, icon in
+                                         zip(rows['Latitude'], rows['Longitude'], rows['Label'],
+                                             rows['Color'], rows['Icon'])])
 
 
 # Function to save project to a CSV file
@@ -114,12 +168,20 @@ def save_project():
 def load_project():
     file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
     if file_path:
-        global df
-        df = pd.read_csv(file_path)
-        coordinates_listbox.delete(0, tk.END)
-        for index, row in df.iterrows():
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row['Icon']}")
+        start_job("Loading project...", read_project_job, file_path, on_done=show_loaded_project)
+
+
+# Background job: parse the project CSV
+def read_project_job(job, file_path):
+    return pd.read_csv(file_path)
+
+
+# Function to replace the current markers with a loaded project (runs on the Tk thread)
+def show_loaded_project(loaded_df):
+    global df
+    df = loaded_df
+    coordinates_listbox.delete(0, tk.END)
+    fill_listbox(df)
 
 
 # Function to pick a color
@@ -160,30 +222,74 @@ def search_markers():
 
 # Function to export the map as an image
 def export_map_as_image():
-    create_map()  # Ensure the map is created and saved as HTML
+    if len(df) == 0:
+        messagebox.showerror("Error", "No markers to add to the map")
+        return
 
-    # Setup Chrome WebDriver
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument('--disable-gpu')
-    driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
+    start_job("Exporting image...", export_image_job, df.copy(), zoom_scale.get(), map_style.get(),
+              cluster_markers.get(), on_done=lambda path: messagebox.showinfo("Export Successful", "Map exported as image successfully"))
 
-    try:
-        driver.get(f"file://{output_map_file}")
-        image = driver.get_screenshot_as_png()
 
-        # Save the screenshot as an image file
-        with open('marked_map.png', 'wb') as file:
-            file.write(image)
-        messagebox.showinfo("Export Successful", "Map exported as image successfully")
-    finally:
-        driver.quit()
+# Background job: render the map to HTML and capture it with a pooled headless Chrome
+def export_image_job(job, markers, zoom_start, tiles, cluster):
+    render_map_job(job, markers, zoom_start, tiles, cluster)  # Ensure the map is created and saved as HTML
+    job.check_cancelled()
+
+    image = browsers.screenshot(Path(output_map_file).resolve().as_uri())
+
+    # Save the screenshot as an image file
+    with open('marked_map.png', 'wb') as file:
+        file.write(image)
+    return 'marked_map.png'
+
+
+# Function to run a long operation in the background with the progress bar and Cancel button
+def start_job(message, func, *args, on_done=None):
+    if jobs.busy:
+        messagebox.showerror("Busy", "Please wait for the current operation to finish or cancel it")
+        return
+
+    def finished(result):
+        hide_progress()
+        if on_done is not None:
+            on_done(result)
+
+    def failed(error):
+        hide_progress()
+        messagebox.showerror("Error", str(error))
+
+    status_var.set(message)
+    progress_bar['value'] = 0
+    cancel_btn.state(['!disabled'])
+    jobs.submit(func, *args, on_done=finished, on_progress=show_progress, on_error=failed,
+                on_cancel=lambda: (hide_progress(), status_var.set("Cancelled")))
+
+
+# Function to update the progress bar
+def show_progress(done, total):
+    progress_bar['maximum'] = max(total, 1)
+    progress_bar['value'] = done
+
+
+def hide_progress():
+    progress_bar['value'] = 0
+    status_var.set("")
+    cancel_btn.state(['disabled'])
+
+
+# Function to close the app, stopping any background job first
+def on_close():
+    jobs.shutdown()
+    browsers.close()
+    root.destroy()
 
 
 # Initialize the main application window
 root = tk.Tk()
 root.title("Map Marker Tool")
-root.geometry("700x600")
+root.geometry("700x650")
+root.protocol("WM_DELETE_WINDOW", on_close)
+jobs = JobRunner(root)
 
 # Create a style for the UI
 style = ttk.Style(root)
@@ -263,6 +369,11 @@ zoom_scale = tk.Scale(main_frame, from_=1, to=18, orient=tk.HORIZONTAL)
 zoom_scale.set(10)
 zoom_scale.grid(row=12, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
 
+# Clustering keeps maps with many markers responsive
+cluster_markers = tk.BooleanVar(value=False)
+ttk.Checkbutton(main_frame, text="Cluster markers", variable=cluster_markers).grid(row=12, column=2, padx=5, pady=5,
+                                                                                 sticky=tk.W)
+
 # Map style options
 ttk.Label(main_frame, text="Map Style:").grid(row=13, column=0, padx=5, pady=5, sticky=tk.W)
 map_style = tk.StringVar(value='OpenStreetMap')
@@ -275,5 +386,14 @@ map_style_menu.grid(row=13, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
 export_image_btn = ttk.Button(main_frame, text="Export as Image", command=export_map_as_image)
 export_image_btn.grid(row=14, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
 
+# Progress of background operations
+status_var = tk.StringVar()
+ttk.Label(main_frame, textvariable=status_var).grid(row=15, column=0, padx=5, pady=5, sticky=tk.W)
+progress_bar = ttk.Progressbar(main_frame, mode='determinate')
+progress_bar.grid(row=15, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+cancel_btn = ttk.Button(main_frame, text="Cancel", command=jobs.cancel)
+cancel_btn.grid(row=15, column=2, padx=5, pady=5, sticky=tk.W)
+cancel_btn.state(['disabled'])
+
 # Start the Tkinter event loop
 root.mainloop()
@@ -1,12 +1,35 @@
 import folium
+import numpy as np
 import pandas as pd
 import webbrowser
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
 
+# Color and Icon only ever take a few values, so they are stored as categorical codes
+COLOR_DTYPE = pd.CategoricalDtype(['green', 'red'])
+ICON_DTYPE = pd.CategoricalDtype(['info-sign'])
+
+
+# Function to build marker rows; the color is derived from Voff for every station at once.
+# The inputs are taken as plain arrays, so the rows line up by position whatever index a
+# caller's Series has.
+def marker_rows(latitudes, longitudes, vons, voffs, descriptions):
+    voffs = np.asarray(voffs, dtype=float)
+    colors = np.where((voffs >= -1.5) & (voffs <= -0.8), 'green', 'red')
+    return pd.DataFrame({
+        'Latitude': np.asarray(latitudes, dtype=float),
+        'Longitude': np.asarray(longitudes, dtype=float),
+        'Von': np.asarray(vons, dtype=float),
+        'Voff': voffs,
+        'Description': np.asarray(descriptions, dtype=object),
+        'Color': pd.Categorical(colors, dtype=COLOR_DTYPE),
+        'Icon': pd.Categorical(['info-sign'] * len(voffs), dtype=ICON_DTYPE),
+    })
+
+
 # Initialize the DataFrame to hold marker data
-df = pd.DataFrame(columns=['Latitude', 'Longitude', 'Von', 'Voff', 'Description', 'Color', 'Icon'])
+df = marker_rows([], [], [], [], [])
 
 # Function to add or update a marker
 def add_marker():
@@ -30,20 +53,19 @@ def add_marker():
         messagebox.showerror("Input Error", "Latitude, Longitude, Von, and Voff must be numbers")
         return
 
-    # Determine color based on Voff value
-    color = 'green' if -1.5 <= voff <= -0.8 else 'red'
-    icon = 'info-sign'
+    global df
+    new_row = marker_rows([latitude], [longitude], [von], [voff], [description])
 
     selected_index = coordinates_listbox.curselection()
     if selected_index:
         # Update existing marker
         index = selected_index[0]
-        df.iloc[index] = [latitude, longitude, von, voff, description, color, icon]
+        df.iloc[index] = new_row.iloc[0]
         coordinates_listbox.delete(index)
         coordinates_listbox.insert(index, f"{description} ({latitude}, {longitude}) - Von: {von}, Voff: {voff}")
     else:
         # Add new marker
-        df.loc[len(df)] = [latitude, longitude, von, voff, description, color, icon]
+        df = pd.concat([df, new_row], ignore_index=True)
         coordinates_listbox.insert(tk.END, f"{description} ({latitude}, {longitude}) - Von: {von}, Voff: {voff}")
 
     # Clear the input fields
@@ -95,28 +117,15 @@ def load_from_excel():
             if not all(column in excel_df.columns for column in required_columns):
                 raise ValueError("The Excel file must contain the following headers: latitude, longitude, von, voff, description")
 
-            # Clear the current DataFrame and Listbox before loading new data
+            # Replace the current DataFrame and Listbox contents with the new data
             global df
-            df = pd.DataFrame(columns=['Latitude', 'Longitude', 'Von', 'Voff', 'Description', 'Color', 'Icon'])
+            df = marker_rows(excel_df['latitude'], excel_df['longitude'], excel_df['von'], excel_df['voff'],
+                             excel_df['description'])
             coordinates_listbox.delete(0, tk.END)
-
-            # Process each row and insert it into the DataFrame and Listbox
-            for index, row in excel_df.iterrows():
-                latitude = row['latitude']
-                longitude = row['longitude']
-                von = row['von']
-                voff = row['voff']
-                description = row['description']
-
-                # Determine color based on the value of voff
-                color = 'green' if -1.5 <= voff <= -0.8 else 'red'
-                icon = 'info-sign'
-
-                # Add to DataFrame
-                df.loc[len(df)] = [latitude, longitude, von, voff, description, color, icon]
-
-                # Insert into Listbox for display
-                coordinates_listbox.insert(tk.END, f"{description} ({latitude}, {longitude}) - Von: {von}, Voff: {voff}")
+            coordinates_listbox.insert(tk.END, *[f"{description} ({latitude}, {longitude}) - Von: {von}, Voff: {voff}"
+                                                 for latitude, longitude, von, voff, description in zip(
+                                                     df['Latitude'], df['Longitude'], df['Von'], df['Voff'],
+                                                     df['Description'])])
 
             messagebox.showinfo("Success", "Data loaded successfully from Excel file")
         except Exception as e:
@@ -0,0 +1,109 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from marker_store import MarkerStore
+from map_builder import build_map
+from workers import DetachedJob
+
+# Compares the folium.Marker path ('markers') with canvas circles ('circles'): build time and
+# HTML size of the saved map, and, when Selenium and Chrome are available, the frame rate of
+# the page while it is panned.
+#
+#   python my_map_marker_tool/benchmark_render.py --sizes 10000 100000
+DEFAULT_SIZES = (10000, 100000)
+DEFAULT_MODES = ('markers', 'circles')
+# OPM-style compliance dots spread over Peninsular Malaysia
+BOUNDS = (1.3, 6.7, 100.1, 104.3)
+PAN_SECONDS = 3
+
+# Pans the map by a few pixels every animation frame for the given time and hands back the
+# frames per second. Non-animated panBy fires moveend each time, so every frame redraws the
+# markers.
+FPS_SCRIPT = """
+var seconds = arguments[0], done = arguments[arguments.length - 1];
+var map = Object.keys(window).map(function(key) { return window[key]; })
+    .filter(function(value) { return value instanceof L.Map; })[0];
+var frames = 0, start = performance.now(), step = 1;
+function frame(now) {
+    frames++;
+    step = -step;
+    map.panBy([40 * step, 20 * step], {animate: false});
+    if (now - start < seconds * 1000) {
+        requestAnimationFrame(frame);
+    } else {
+        done(frames * 1000 / (now - start));
+    }
+}
+requestAnimationFrame(frame);
+"""
+
+
+def synthetic_store(count, seed=0):
+    rng = np.random.default_rng(seed)
+    south, north, west, east = BOUNDS
+    return MarkerStore.from_dataframe(pd.DataFrame({
+        'Latitude': rng.uniform(south, north, count),
+        'Longitude': rng.uniform(west, east, count),
+        'Label': [f'Station {i}' for i in range(count)],
+        'Color': rng.choice(['green', 'red'], count, p=[0.8, 0.2]),
+        'Icon': 'info-sign',
+    }))
+
+
+# Headless Chrome through Selenium, or None when either is missing
+def start_browser():
+    try:
+        from selenium import webdriver
+    except ImportError:
+        return None
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--window-size=1280,800')
+    try:
+        return webdriver.Chrome(options=options)
+    except Exception as e:
+        print(f"Frame rate skipped, Chrome could not be started: {e}")
+        return None
+
+
+def measure_fps(driver, path):
+    driver.set_script_timeout(PAN_SECONDS + 120)
+    driver.get(Path(path).resolve().as_uri())
+    return driver.execute_async_script(FPS_SCRIPT, PAN_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark map render modes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--modes', nargs='+', default=DEFAULT_MODES)
+    parser.add_argument('--output-dir', default='benchmark_maps')
+    parser.add_argument('--no-browser', action='store_true', help="only measure build time and file size")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    driver = None if args.no_browser else start_browser()
+    if driver is None and not args.no_browser:
+        print("Frame rate skipped: install selenium and Chrome to measure it")
+    print(f"{'markers':>8} {'mode':>8} {'build s':>8} {'HTML MB':>8} {'fps':>6}")
+    try:
+        for size in args.sizes:
+            store = synthetic_store(size)
+            for mode in args.modes:
+                path = os.path.join(args.output_dir, f'{mode}_{size}.html')
+                start = time.perf_counter()
+                build_map(DetachedJob(), [store], size, [store.latitudes[0], store.longitudes[0]], path, mode)
+                seconds = time.perf_counter() - start
+                fps = f'{measure_fps(driver, path):6.1f}' if driver is not None else f'{"-":>6}'
+                print(f'{size:>8} {mode:>8} {seconds:>8.2f} {os.path.getsize(path) / 2 ** 20:>8.2f} {fps}')
+    finally:
+        if driver is not None:
+            driver.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+# Where the path of the downloaded ChromeDriver is remembered between runs, so later runs
+# start Chrome without asking webdriver-manager (and the network) for the latest driver
+DRIVER_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.map_marker_tool', 'chromedriver.json')
+WINDOW_SIZE = (1280, 800)
+
+
+# Headless Chrome sessions kept open between screenshots.
+#
+# Starting Chrome and resolving its driver takes seconds, while loading a page into a running
+# session takes a fraction of that. Sessions are started on first use, up to `size` at a time,
+# and handed out with session(); a session that stopped responding is replaced. Call close()
+# when the app exits to quit them all. Selenium is only imported when the first session starts.
+class BrowserPool:
+    def __init__(self, size=1, driver_cache_file=DRIVER_CACHE_FILE, window_size=WINDOW_SIZE):
+        self.size = size
+        self.driver_cache_file = driver_cache_file
+        self.window_size = window_size
+        # Notified whenever a session is given back or a slot frees up
+        self._available = threading.Condition()
+        # Most recently used session last
+        self._idle = []
+        self._sessions = []
+        self._closed = False
+
+    # Borrow a WebDriver for the duration of a with block
+    @contextmanager
+    def session(self):
+        driver = self._acquire()
+        try:
+            yield driver
+        finally:
+            self._release(driver)
+
+    # PNG screenshot of a page, e.g. a saved map opened through pathlib.Path.as_uri()
+    def screenshot(self, url):
+        with self.session() as driver:
+            driver.get(url)
+            return driver.get_screenshot_as_png()
+
+    # Quit every session; sessions still in use quit when they are given back
+    def close(self):
+        with self._available:
+            self._closed = True
+            sessions, self._sessions = self._sessions, []
+            self._idle = []
+            self._available.notify_all()
+        for driver in sessions:
+            _quit(driver)
+
+    # An idle session, or a new one while fewer than `size` are open; otherwise wait until a
+    # session is given back or one that died frees its slot
+    def _acquire(self):
+        while True:
+            with self._available:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("The browser pool is closed")
+                    if self._idle:
+                        driver = self._idle.pop()
+                        break
+                    if len(self._sessions) < self.size:
+                        # Reserve the slot; the browser starts outside the lock
+                        self._sessions.append(None)
+                        driver = None
+                        break
+                    self._available.wait()
+            if driver is None:
+                return self._start()
+            if _alive(driver):
+                return driver
+            self._forget(driver)
+
+    def _release(self, driver):
+        if _alive(driver):
+            with self._available:
+                if not self._closed:
+                    self._idle.append(driver)
+                    self._available.notify()
+                    return
+        self._forget(driver)
+
+    def _start(self):
+        try:
+            driver = self._new_driver()
+        except BaseException:
+            with self._available:
+                if None in self._sessions:
+                    self._sessions.remove(None)
+                self._available.notify()
+            raise
+        with self._available:
+            closed = self._closed
+            if not closed:
+                self._sessions[self._sessions.index(None)] = driver
+        if closed:
+            _quit(driver)
+            raise RuntimeError("The browser pool is closed")
+        return driver
+
+    def _forget(self, driver):
+        with self._available:
+            if driver in self._sessions:
+                self._sessions.remove(driver)
+            self._available.notify()
+        _quit(driver)
+
+    def _new_driver(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromeService
+
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless')
+        options.add_argument('--disable-gpu')
+        options.add_argument(f'--window-size={self.window_size[0]},{self.window_size[1]}')
+        driver_path = self._driver_path()
+        # Without a driver path Selenium Manager looks for one itself
+        service = ChromeService(driver_path) if driver_path else ChromeService()
+        return webdriver.Chrome(service=service, options=options)
+
+    # Path of a ChromeDriver executable: the cached one if it still exists, else the one
+    # webdriver-manager installs (which is then cached), else None
+    def _driver_path(self):
+        try:
+            with open(self.driver_cache_file, encoding='utf-8') as file:
+                path = json.load(file).get('driver_path')
+            if path and os.path.isfile(path):
+                return path
+        except (OSError, ValueError):
+            pass
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            path = ChromeDriverManager().install()
+        except Exception:
+            # Not installed or offline
+            return None
+        try:
+            os.makedirs(os.path.dirname(self.driver_cache_file), exist_ok=True)
+            with open(self.driver_cache_file, 'w', encoding='utf-8') as file:
+                json.dump({'driver_path': path}, file)
+        except OSError:
+            pass
+        return path
+
+
+# Whether a session still answers; a crashed or closed browser raises
+def _alive(driver):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def _quit(driver):
+    if driver is None:
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
@@ -0,0 +1,107 @@
+import numpy as np
+
+# Zoom levels that may get precomputed clusters; from the index's detail zoom on the raw
+# markers are shown instead
+MIN_ZOOM = 0
+MAX_CLUSTER_ZOOM = 14
+# Clustering stops at the first zoom level with more clusters than this share of the
+# markers: such a level hardly reduces anything, and the raw markers are shown from there on
+DETAIL_FRACTION = 0.25
+# Cluster radius in screen pixels (Leaflet tiles are 256 px wide)
+CLUSTER_RADIUS = 60
+TILE_SIZE = 256
+# Web Mercator cannot show the poles
+MAX_LATITUDE = 85.05112878
+
+
+# Hierarchical, supercluster-style clustering of marker positions, computed with NumPy.
+#
+# Positions are projected to Web Mercator once. The most detailed level groups the markers
+# into grid cells CLUSTER_RADIUS pixels wide at MAX_CLUSTER_ZOOM; every coarser level groups
+# the clusters of the level below it, so each level costs one np.unique over at most as many
+# entries as the level below. Every cluster keeps its marker count, its weighted centre and
+# one representative marker row, which is the marker itself for single-marker clusters.
+#
+# Levels from `detail_zoom` on are not kept (see DETAIL_FRACTION); viewers show the raw
+# markers there, grouped by tile with `tiles()`.
+class ClusterIndex:
+    def __init__(self, latitudes, longitudes, min_zoom=MIN_ZOOM, max_zoom=MAX_CLUSTER_ZOOM, radius=CLUSTER_RADIUS,
+                 detail_fraction=DETAIL_FRACTION):
+        self.min_zoom = min_zoom
+        self.x, self.y = project(latitudes, longitudes)
+
+        # level zoom -> (x, y, count, representative row)
+        self._levels = {}
+        x, y = self.x, self.y
+        counts = np.ones(len(x), dtype=np.int64)
+        rows = np.arange(len(x), dtype=np.int64)
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            cells = TILE_SIZE * 2 ** zoom / radius
+            keys = cell_keys(x, y, cells)
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            weight = np.bincount(inverse, weights=counts)
+            x = np.bincount(inverse, weights=x * counts) / weight
+            y = np.bincount(inverse, weights=y * counts) / weight
+            counts = weight.astype(np.int64)
+            rows = rows[first]
+            self._levels[zoom] = (x, y, counts, rows)
+
+        # Keep the levels up to the first one that is too detailed to be worth embedding
+        self.detail_zoom = max_zoom + 1
+        for zoom in range(min_zoom, max_zoom + 1):
+            if len(self._levels[zoom][2]) > detail_fraction * len(self.x):
+                self.detail_zoom = max(zoom, min_zoom + 1)
+                break
+        self.max_zoom = self.detail_zoom - 1
+        for zoom in range(self.detail_zoom, max_zoom + 1):
+            del self._levels[zoom]
+
+    def __len__(self):
+        return len(self.x)
+
+    # Clusters shown at `zoom` as (latitudes, longitudes, counts, representative rows)
+    def clusters(self, zoom):
+        zoom = min(max(zoom, self.min_zoom), self.max_zoom)
+        x, y, counts, rows = self._levels[zoom]
+        latitudes, longitudes = unproject(x, y)
+        return latitudes, longitudes, counts, rows
+
+    # Marker rows grouped by the Web Mercator tile they fall in at `zoom` (by default the
+    # detail zoom), as a {(tile_x, tile_y): rows} dict, so a viewer only has to look at the
+    # visible tiles
+    def tiles(self, zoom=None):
+        zoom = self.detail_zoom if zoom is None else zoom
+        scale = 2 ** zoom
+        tile_x = np.clip((self.x * scale).astype(np.int64), 0, scale - 1)
+        tile_y = np.clip((self.y * scale).astype(np.int64), 0, scale - 1)
+        keys = tile_x * scale + tile_y
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        groups = np.split(order, starts[1:])
+        return {(int(key // scale), int(key % scale)): rows
+                for key, rows in zip(sorted_keys[starts].tolist(), groups)}
+
+
+# Latitude/longitude to Web Mercator coordinates in [0, 1] (y grows southwards)
+def project(latitudes, longitudes):
+    latitudes = np.clip(np.asarray(latitudes, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    sin = np.sin(np.radians(latitudes))
+    x = (longitudes + 180) / 360
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    return x, y
+
+
+def unproject(x, y):
+    longitudes = x * 360 - 180
+    latitudes = np.degrees(2 * np.arctan(np.exp((0.5 - y) * 2 * np.pi)) - np.pi / 2)
+    return latitudes, longitudes
+
+
+# Key of the grid cell every projected position falls in, for a grid of `cells` x `cells`
+def cell_keys(x, y, cells):
+    size = int(np.ceil(cells)) + 1
+    cell_x = np.floor(x * cells).astype(np.int64)
+    cell_y = np.floor(y * cells).astype(np.int64)
+    return cell_x * size + cell_y
@@ -0,0 +1,35 @@
+import numpy as np
+
+from cluster_index import project, unproject
+
+# The longer side of the markers' extent is split into this many cells, so a density grid
+# never has more than DENSITY_BINS x DENSITY_BINS cells however many markers there are
+DENSITY_BINS = 128
+# Smallest cell side in Web Mercator units (about 2 m at the equator), for markers that
+# (nearly) all share one position
+MIN_CELL_SIZE = 2.0 ** -24
+
+
+# Marker counts on a grid of cells that are square in Web Mercator (square on screen).
+#
+# The grid covers the markers' extent; positions are projected once and counted with
+# np.histogram2d, and only the cells holding markers are kept: `columns`, `rows` and `counts`
+# per non-empty cell, with the cell edges in `longitudes` (west to east) and `latitudes`
+# (north to south), so column c and row r span longitudes[c:c + 2] and latitudes[r:r + 2].
+class DensityGrid:
+    def __init__(self, latitudes, longitudes, bins=DENSITY_BINS):
+        x, y = project(latitudes, longitudes)
+        west, north = x.min(), y.min()
+        size = max(x.max() - west, y.max() - north) / bins
+        size = max(size, MIN_CELL_SIZE)
+        x_bins = min(int((x.max() - west) / size) + 1, bins)
+        y_bins = min(int((y.max() - north) / size) + 1, bins)
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=(x_bins, y_bins),
+                                                  range=((west, west + x_bins * size), (north, north + y_bins * size)))
+        self.columns, self.rows = np.nonzero(counts)
+        self.counts = counts[self.columns, self.rows].astype(np.int64)
+        self.latitudes, _ = unproject(np.zeros(len(y_edges)), y_edges)
+        _, self.longitudes = unproject(x_edges, np.zeros(len(x_edges)))
+
+    def __len__(self):
+        return len(self.counts)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from marker_store import COLUMNS, DEFAULT_ICON
+from validation import resolve_columns, validate_markers
+
+
+# Turn a raw spreadsheet frame into the marker column layout and validate every row with
+# column operations only. Returns a ValidationReport whose `valid_frame` is ready to append.
+# `first_line` is the sheet line of the frame's first row (the header is line 1); `lines`
+# gives the sheet line of every row instead, see validate_markers.
+def prepare_marker_frame(raw_df, first_line=2, lines=None):
+    resolved = resolve_columns(raw_df.columns)
+    frame = pd.DataFrame({column: raw_df[source] for column, source in resolved.items()})
+    if 'Icon' not in frame.columns:
+        frame['Icon'] = DEFAULT_ICON
+    frame['Icon'] = frame['Icon'].fillna(DEFAULT_ICON)
+    return validate_markers(frame[COLUMNS], first_line, lines)
+
+
+# Append a frame already in the marker column layout; returns the first new row number
+def append_frame(store, frame, ids=None):
+    start = len(store)
+    store.extend(frame['Latitude'].to_numpy(), frame['Longitude'].to_numpy(),
+                 frame['Label'].tolist(), frame['Color'].tolist(), frame['Icon'].tolist(), ids=ids)
+    return start
+
+
+# Read an .xlsx sheet in fixed-size chunks with openpyxl's read-only mode so only one
+# chunk of rows is held in memory at a time. Blank rows are skipped. Yields (chunk DataFrame,
+# sheet line of every chunk row, rows read, total rows).
+def iter_excel_chunks(file_path, chunk_size=5000):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        # max_row comes from the sheet's dimension record and may be missing or stale
+        total = max((sheet.max_row or 1) - 1, 0)
+        rows = sheet.iter_rows(values_only=True)
+        headers = next(rows, None)
+        if headers is None:
+            return
+        headers = [str(header) if header is not None else '' for header in headers]
+        resolve_columns(headers)
+
+        done = 0
+        chunk, lines = [], []
+        # The header is line 1
+        for line, values in enumerate(rows, 2):
+            if not any(value is not None for value in values):
+                continue
+            chunk.append(values)
+            lines.append(line)
+            if len(chunk) >= chunk_size:
+                done += len(chunk)
+                yield pd.DataFrame.from_records(chunk, columns=headers), np.array(lines), done, max(total, done)
+                chunk, lines = [], []
+        if chunk:
+            done += len(chunk)
+            yield pd.DataFrame.from_records(chunk, columns=headers), np.array(lines), done, max(total, done)
+    finally:
+        workbook.close()
@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+
+from project_io import load_binary_project, save_binary_project
+
+# Compact the journal into a fresh snapshot once it holds this many records
+COMPACT_AFTER = 10000
+
+
+# Append-only change log for a binary project file.
+#
+# Every add/update/delete is written as one JSON line keyed by the marker id as the edit
+# happens, so saving never rewrites the whole project. Compaction moves the journal aside
+# to `<project>.journal.compacting`, writes a snapshot of the markers in a background
+# thread and then deletes the moved journal. Loading replays snapshot + any leftover
+# journals; replay is idempotent, so a crash at any point loses no edits.
+class ProjectJournal:
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.journal_path = project_path + '.journal'
+        self.compacting_path = project_path + '.journal.compacting'
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._records = _count_lines(self.journal_path)
+        self._compactor = None
+
+    @property
+    def compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    @property
+    def needs_compaction(self):
+        return self._records >= COMPACT_AFTER
+
+    def record_add(self, store, row):
+        self._write([_marker_record('add', store, row)])
+
+    def record_update(self, store, row):
+        self._write([_marker_record('update', store, row)])
+
+    def record_delete(self, marker_id):
+        self._write([{'op': 'delete', 'id': marker_id}])
+
+    # Record every row from `start` on as added, in a single write (bulk imports)
+    def record_adds(self, store, start):
+        self._write([_marker_record('add', store, row) for row in range(start, len(store))])
+
+    # Write a snapshot of `snapshot` (a copy of the current markers) in the background.
+    # Edits made meanwhile keep going to a fresh journal file.
+    def compact(self, snapshot, on_done=None):
+        if self.compacting:
+            return False
+        self._file.close()
+        if os.path.exists(self.compacting_path):
+            # A previous compaction never finished: keep its records ahead of the new ones
+            _append_file(self.compacting_path, self.journal_path)
+        os.replace(self.journal_path, self.compacting_path)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._records = 0
+
+        def run():
+            save_binary_project(snapshot, self.project_path)
+            os.remove(self.compacting_path)
+            if on_done is not None:
+                on_done()
+
+        self._compactor = threading.Thread(target=run, name='project-compaction', daemon=True)
+        self._compactor.start()
+        return True
+
+    # Wait for a running compaction, e.g. before the app exits
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        self._file.close()
+
+    def _write(self, records):
+        if not records:
+            return
+        self._file.write(''.join(json.dumps(record) + '\n' for record in records))
+        self._file.flush()
+        self._records += len(records)
+
+
+# Load a binary project and replay any journals written since its last snapshot
+def open_project(project_path):
+    store = load_binary_project(project_path)
+    for path in (project_path + '.journal.compacting', project_path + '.journal'):
+        if os.path.exists(path):
+            replay(store, path)
+    return store
+
+
+# Apply the records of a journal file to a store
+def replay(store, journal_path):
+    with open(journal_path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from a crash mid-write; everything before it is intact
+                break
+            row = store.row_of(record['id'])
+            if record['op'] == 'delete':
+                if row is not None:
+                    store.delete(row)
+            elif row is None:
+                store.append(record['lat'], record['lon'], record['label'], record['color'], record['icon'],
+                             marker_id=record['id'])
+            else:
+                store.update(row, record['lat'], record['lon'], record['label'], record['color'], record['icon'])
+
+
+def _marker_record(op, store, row):
+    marker = store.row(row)
+    return {'op': op, 'id': store.marker_id(row), 'lat': marker['Latitude'], 'lon': marker['Longitude'],
+            'label': marker['Label'], 'color': marker['Color'], 'icon': marker['Icon']}
+
+
+def _count_lines(path):
+    with open(path, 'rb') as file:
+        return sum(1 for _ in file)
+
+
+def _append_file(source_path, target_path):
+    with open(source_path, 'rb') as source, open(target_path, 'rb') as target:
+        combined = source.read() + target.read()
+    with open(target_path, 'wb') as target:
+        target.write(combined)
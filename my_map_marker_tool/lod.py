@@ -0,0 +1,41 @@
+import numpy as np
+
+from cluster_index import TILE_SIZE, cell_keys, project
+
+MIN_ZOOM = 0
+# From this zoom level on every marker is shown
+MAX_ZOOM = 18
+# At each zoom level one marker per THIN_PIXELS x THIN_PIXELS screen square is shown, so a
+# 1280 x 800 px map shows at most ~450 markers however far it is zoomed out
+THIN_PIXELS = 48
+# Markers in these colors (red = non-compliant in the OPM sheets) are priority markers
+PRIORITY_COLORS = ('red', 'darkred')
+
+
+# Level-of-detail thinning: the zoom level from which each marker is shown.
+#
+# Per zoom level the positions are snapped to a grid of THIN_PIXELS cells and each occupied
+# cell keeps one marker: a priority marker if the cell has one, else the first marker of the
+# cell in row order. Priority markers thus only give way to other priority markers, while the
+# number of markers on screen stays bounded by the grid. Grid cells of a zoom level split into
+# 4 at the next, so a marker kept at one level is kept at every deeper level: the subsets are
+# nested, and a page can show the markers whose zoom is at most the current one.
+def detail_zooms(latitudes, longitudes, priority, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, thin_pixels=THIN_PIXELS):
+    x, y = project(latitudes, longitudes)
+    priority = np.asarray(priority, dtype=bool)
+    # Priority rows first, so they win the cells they are in
+    order = np.r_[np.flatnonzero(priority), np.flatnonzero(~priority)]
+    zooms = np.full(len(x), max_zoom, dtype=np.int64)
+
+    for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+        _, first = np.unique(cell_keys(x[order], y[order], TILE_SIZE * 2 ** zoom / thin_pixels), return_index=True)
+        zooms[order[first]] = zoom
+    return zooms
+
+
+# Markers in one of `colors` as a boolean mask over the rows of `store`
+def priority_mask(store, colors=PRIORITY_COLORS):
+    mask = np.zeros(len(store), dtype=bool)
+    for color in colors:
+        mask[store.rows_where('Color', color)] = True
+    return mask
@@ -1,12 +1,47 @@
-import folium
 import pandas as pd
+import os
 import webbrowser
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, colorchooser
 from PIL import ImageTk, Image
-
-# Initialize the DataFrame to hold marker data
-df = pd.DataFrame(columns=['Latitude', 'Longitude', 'Label', 'Color', 'Icon'])
+from marker_store import MarkerStore
+from importers import append_frame, iter_excel_chunks, prepare_marker_frame
+from validation import ICON_NAMES, ValidationReport, validate_markers
+from workers import JobRunner
+from renderers import RENDER_MODES, marker_colors
+from render_cache import RenderCache, fingerprint
+from map_builder import MAP_ZOOM_START, build_map, gather_batches, tracked_tiles
+from vector_tiles import marker_bounds, vector_tiles, write_mbtiles, write_tile_directory
+from map_server import MarkerServer, serve_directory, stop_servers
+from partitions import render_partitions
+from project_io import BINARY_EXTENSION, is_binary_project, load_project_file, save_csv_project, save_project_file
+from journal import ProjectJournal, open_project
+from sqlite_store import SqliteProject, is_sqlite_project
+
+# Workbooks at least this large are imported in chunks instead of with pd.read_excel
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+EXCEL_CHUNK_SIZE = 5000
+PROJECT_FILETYPES = [("Map marker project", "*" + BINARY_EXTENSION), ("SQLite project", "*.sqlite"),
+                     ("CSV files", "*.csv")]
+# With a SQLite project open, at most this many markers are held in memory for the list
+LIST_LIMIT = 5000
+MBTILES_EXTENSION = '.mbtiles'
+# Marker columns the GUI can split maps by
+SPLIT_COLUMNS = ['Color', 'Icon']
+
+# Initialize the marker store; a DataFrame is only built when saving
+store = MarkerStore()
+# Change journal of the open binary project, if any; edits are appended to it as they happen
+journal = None
+# Marker ids in list widget order, so list positions map to markers even when the list is filtered
+listed_ids = []
+# Open SQLite project, if any. `store` then only holds the markers shown in the list and
+# every edit is written straight to the database.
+database = None
+# What the last map was built from; lets create_map skip unchanged maps and marker chunks
+render_cache = RenderCache()
+# Local server answering viewport queries of the open browser page, if one was started
+marker_server = None
 
 
 # Function to add or update a marker
@@ -23,24 +58,38 @@ def add_marker():
         messagebox.showerror("Input Error", "All fields must be filled out")
         return
 
-    try:
-        latitude = float(latitude)
-        longitude = float(longitude)
-    except ValueError:
-        messagebox.showerror("Input Error", "Latitude and Longitude must be numbers")
+    # Same checks as for imported files
+    report = validate_markers(pd.DataFrame({'Latitude': [latitude], 'Longitude': [longitude], 'Label': [name],
+                                            'Color': [color], 'Icon': [icon]}))
+    if not report.ok:
+        messagebox.showerror("Input Error", "\n".join(f"{error.Column}: {error.Problem}"
+                                                      for error in report.errors.itertuples()))
         return
+    marker = report.valid_frame.iloc[0]
+    latitude, longitude, color = float(marker['Latitude']), float(marker['Longitude']), marker['Color']
 
-    selected_index = coordinates_listbox.curselection()
-    if selected_index:
+    position, row = selected_marker()
+    if row is not None:
         # Update existing marker
-        index = selected_index[0]
-        df.iloc[index] = [latitude, longitude, name, color, icon]
-        coordinates_listbox.delete(index)
-        coordinates_listbox.insert(index, f"{name} ({latitude}, {longitude}) - {color} - {icon}")
+        store.update(row, latitude, longitude, name, color, icon)
+        if journal is not None:
+            journal.record_update(store, row)
+        if database is not None:
+            database.update(store.marker_id(row), latitude, longitude, name, color, icon)
+        if marker_server is not None:
+            marker_server.put_marker(store.marker_id(row), latitude, longitude, name, color, icon)
+        coordinates_listbox.delete(position)
+        coordinates_listbox.insert(position, store.describe(row))
     else:
         # Add new marker
-        df.loc[len(df)] = [latitude, longitude, name, color, icon]
-        coordinates_listbox.insert(tk.END, f"{name} ({latitude}, {longitude}) - {color} - {icon}")
+        marker_id = database.add(latitude, longitude, name, color, icon) if database is not None else None
+        row = store.append(latitude, longitude, name, color, icon, marker_id=marker_id)
+        if journal is not None:
+            journal.record_add(store, row)
+        if marker_server is not None:
+            marker_server.put_marker(store.marker_id(row), latitude, longitude, name, color, icon)
+        list_rows_from(row)
+    compact_journal_if_needed()
 
     # Clear the input fields
     name_entry.delete(0, tk.END)
@@ -51,33 +100,166 @@ def add_marker():
 
 # Function to create the map and open it in the browser
 def create_map():
-    if len(df) == 0:
+    if (len(database) if database is not None else len(store)) == 0:
         messagebox.showerror("Error", "No markers to add to the map")
         return
 
-    initial_location = [df['Latitude'].iloc[0], df['Longitude'].iloc[0]]
-    mymap = folium.Map(location=initial_location, zoom_start=12)
+    output_map_file = 'marked_map.html'
+    render_mode = render_mode_var.get()
+    if database is not None:
+        start_job("Creating map...", render_database_job, database.file_path, output_map_file, render_mode,
+                  on_done=lambda path: open_map(path, render_mode))
+    else:
+        start_job("Creating map...", render_map_job, store.copy(), output_map_file, render_mode,
+                  on_done=lambda path: open_map(path, render_mode))
 
-    for index, row in df.iterrows():
-        folium.Marker(
-            location=[row['Latitude'], row['Longitude']],
-            popup=row['Label'],
-            icon=folium.Icon(color=row['Color'], icon=row['Icon'])
-        ).add_to(mymap)
 
-    output_map_file = 'marked_map.html'
-    mymap.save(output_map_file)
-    webbrowser.open(output_map_file)
+# Function to open a saved map in the browser. Vector tile maps fetch their tiles, which
+# browsers refuse for file:// pages, so they are opened through a local HTTP server.
+def open_map(path, render_mode):
+    if render_mode == 'vector':
+        path = os.path.abspath(path)
+        webbrowser.open(serve_directory(os.path.dirname(path)) + os.path.basename(path))
+    else:
+        webbrowser.open(path)
+
+
+# Function to browse the markers through a local server that sends the browser only the
+# markers in view, instead of writing them all into one HTML file. Once it runs, edits show up
+# on the open page as they are made; pressing the button again re-indexes all markers and
+# reloads that page instead of opening another tab.
+def serve_map():
+    if (len(database) if database is not None else len(store)) == 0:
+        messagebox.showerror("Error", "No markers to add to the map")
+        return
+    markers = None if database is not None else store.copy()
+    edits_before = marker_server.edit_sequence if marker_server is not None else None
+    start_job("Indexing markers...", start_server_job, marker_server, markers,
+              database.file_path if database is not None else None, edits_before, on_done=show_served_map)
+
+
+# Background job: index a marker snapshot and serve it, or serve a SQLite project straight
+# from its R*Tree index without loading it, from the running server if there is one
+def start_server_job(job, server, markers, database_path, edits_before):
+    if database_path is not None:
+        project = SqliteProject(database_path)
+        try:
+            location = project.first_location()
+        finally:
+            project.close()
+        if server is None:
+            return MarkerServer(database_path, location, MAP_ZOOM_START)
+        server.load_database(database_path, location, MAP_ZOOM_START, edits_before=edits_before)
+        return server
+    location = [markers.latitudes[0], markers.longitudes[0]]
+    if server is None:
+        return MarkerServer(markers, location, MAP_ZOOM_START)
+    server.load(markers, location, MAP_ZOOM_START, edits_before=edits_before)
+    return server
+
+
+# Function to open the served map, unless a page of it is still open (it reloads itself)
+def show_served_map(server):
+    global marker_server
+    if server is not marker_server or server.viewers == 0:
+        webbrowser.open(server.url)
+    marker_server = server
+
+
+# Background job: build the folium map from a snapshot of the markers and save it, unless
+# the last map was built from the same markers and settings
+def render_map_job(job, markers, output_map_file, render_mode):
+    map_fingerprint = fingerprint(markers, {'render_mode': render_mode, 'zoom_start': MAP_ZOOM_START})
+    if render_cache.is_current(output_map_file, map_fingerprint):
+        return output_map_file
+    initial_location = [markers.latitudes[0], markers.longitudes[0]]
+    build_map(job, [markers], len(markers), initial_location, output_map_file, render_mode, cache=render_cache)
+    render_cache.remember(output_map_file, map_fingerprint)
+    return output_map_file
+
+
+# Background job: build the folium map from a SQLite project, reading it in batches
+def render_database_job(job, database_path, output_map_file, render_mode):
+    project = SqliteProject(database_path)
+    try:
+        build_map(job, project.iter_batches(), len(project), project.first_location(), output_map_file, render_mode,
+                  cache=render_cache)
+        render_cache.remember(output_map_file)
+        return output_map_file
+    finally:
+        project.close()
+
+
+# Function to export the markers as vector tiles, to an MBTiles file or a tile folder
+def export_tiles():
+    if (len(database) if database is not None else len(store)) == 0:
+        messagebox.showerror("Error", "No markers to export")
+        return
+    file_path = filedialog.asksaveasfilename(defaultextension=MBTILES_EXTENSION,
+                                             filetypes=[("MBTiles", "*" + MBTILES_EXTENSION), ("Tile folder", "*")])
+    if file_path:
+        markers = None if database is not None else store.copy()
+        start_job("Exporting vector tiles...", export_tiles_job, markers,
+                  database.file_path if database is not None else None, file_path,
+                  on_done=lambda count: messagebox.showinfo("Export Successful", f"{count} vector tiles exported"))
+
+
+# Background job: write vector tiles of a marker snapshot or of a SQLite project
+def export_tiles_job(job, markers, database_path, file_path):
+    if database_path is not None:
+        project = SqliteProject(database_path)
+        try:
+            markers = gather_batches(job, project.iter_batches(), len(project))
+        finally:
+            project.close()
+    tiles = tracked_tiles(job, vector_tiles(markers, marker_colors(markers)))
+    if file_path.lower().endswith(MBTILES_EXTENSION):
+        return write_mbtiles(tiles, file_path, bounds=marker_bounds(markers))
+    return write_tile_directory(tiles, file_path)
+
+
+# Function to build one map per value of a marker column (e.g. one per color group) into a
+# folder, plus an index page linking them, and open the index
+def create_split_maps():
+    if (len(database) if database is not None else len(store)) == 0:
+        messagebox.showerror("Error", "No markers to add to the map")
+        return
+    output_dir = filedialog.askdirectory(title="Folder for the split maps")
+    if output_dir:
+        markers = None if database is not None else store.copy()
+        render_mode = render_mode_var.get()
+        # Through open_map, so vector tile maps are served over HTTP like a single map
+        start_job("Creating split maps...", split_maps_job, markers,
+                  database.file_path if database is not None else None, split_column_var.get(), output_dir,
+                  render_mode, on_done=lambda index_path: open_map(index_path, render_mode))
+
+
+# Background job: render the partitions of a marker snapshot or of a SQLite project in
+# worker processes
+def split_maps_job(job, markers, database_path, column, output_dir, render_mode):
+    if database_path is not None:
+        project = SqliteProject(database_path)
+        try:
+            markers = gather_batches(job, project.iter_batches(), len(project))
+        finally:
+            project.close()
+    return render_partitions(job, markers, markers.values(column), output_dir, column, render_mode)
 
 
 # Function to delete a marker
 def delete_marker():
-    selected_index = coordinates_listbox.curselection()
-    if selected_index:
-        index = selected_index[0]
-        coordinates_listbox.delete(index)
-        df.drop(df.index[index], inplace=True)
-        df.reset_index(drop=True, inplace=True)
+    position, row = selected_marker()
+    if row is not None:
+        marker_id = listed_ids.pop(position)
+        coordinates_listbox.delete(position)
+        if journal is not None:
+            journal.record_delete(marker_id)
+        if database is not None:
+            database.delete(marker_id)
+        if marker_server is not None:
+            marker_server.remove_marker(marker_id)
+        store.delete(row)
+        compact_journal_if_needed()
     else:
         messagebox.showerror("Delete Error", "No marker selected to delete")
 
@@ -86,32 +268,263 @@ def delete_marker():
 def load_from_excel():
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx")])
     if file_path:
-        excel_df = pd.read_excel(file_path)
-        for index, row in excel_df.iterrows():
-            df.loc[len(df)] = [row['Latitude'], row['Longitude'], row['Label'], row['Color'],
-                               row.get('Icon', 'info-sign')]
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row.get('Icon', 'info-sign')}")
+        if os.path.getsize(file_path) >= STREAMING_THRESHOLD_BYTES:
+            # Large workbooks are read in chunks so markers show up as they load
+            start_job("Loading workbook...", stream_excel_job, file_path,
+                      on_done=show_validation_report, on_progress=show_loaded_chunk)
+        else:
+            start_job("Loading workbook...", read_excel_job, file_path, on_done=show_loaded_workbook)
+
+
+# Background job: read and validate a whole workbook
+def read_excel_job(job, file_path):
+    return prepare_marker_frame(pd.read_excel(file_path))
+
+
+# Background job: read a workbook chunk by chunk, handing the valid rows of each chunk to the
+# Tk thread. Returns the validation report of the whole workbook.
+def stream_excel_job(job, file_path):
+    reports = []
+    for chunk, lines, done, total in iter_excel_chunks(file_path, EXCEL_CHUNK_SIZE):
+        job.check_cancelled()
+        report = prepare_marker_frame(chunk, lines=lines)
+        # Only the problems are kept; the valid rows go to the Tk thread and are dropped here
+        reports.append(ValidationReport(None, report.errors, report.total))
+        job.report(done, total, report.valid_frame)
+    return ValidationReport.merge(reports)
+
+
+def show_loaded_workbook(report):
+    show_loaded_chunk(report.total, report.total, report.valid_frame)
+    show_validation_report(report)
+
+
+# Function to tell the user which rows of a loaded file were skipped and why
+def show_validation_report(report):
+    if report is not None and not report.ok:
+        messagebox.showwarning("Invalid Rows", report.summary())
+
+
+# Function to add a loaded chunk of markers to the store and the list (runs on the Tk thread)
+def show_loaded_chunk(done, total, frame):
+    if database is not None:
+        # Everything goes into the database; only the first LIST_LIMIT markers stay in memory
+        chunk = MarkerStore(capacity=len(frame))
+        append_frame(chunk, frame)
+        ids = database.add_store(chunk)
+        shown = max(LIST_LIMIT - len(store), 0)
+        start = append_frame(store, frame.iloc[:shown], ids=ids[:shown])
+    else:
+        start = append_frame(store, frame)
+    if journal is not None:
+        journal.record_adds(store, start)
+        compact_journal_if_needed()
+    list_rows_from(start)
+    show_progress(done, total)
 
 
-# Function to save project to a CSV file
+# Function to save the project. Edits to an open binary project are already in its journal,
+# so saving only folds the journal into a new snapshot in the background.
 def save_project():
-    file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
-    if file_path:
-        df.to_csv(file_path, index=False)
+    if journal is not None:
+        journal.compact(store.copy())
         messagebox.showinfo("Save Successful", "Project saved successfully")
+        return
+    if database is not None:
+        # SQLite projects commit every edit as it happens
+        messagebox.showinfo("Save Successful", "Project saved successfully")
+        return
+    save_project_as()
 
 
-# Function to load project from a CSV file
+# Function to save the markers to a new project file (a copy, another place or another format)
+# and continue in that file; saving over the open project just saves it
+def save_project_as():
+    file_path = filedialog.asksaveasfilename(defaultextension=BINARY_EXTENSION, filetypes=PROJECT_FILETYPES)
+    if not file_path:
+        return
+    if database is not None:
+        if same_file(file_path, database.file_path):
+            messagebox.showinfo("Save Successful", "Project saved successfully")
+        else:
+            # The list only holds the first markers of a database, so the copy is made from the file
+            start_job("Saving project...", save_database_job, database.file_path, file_path,
+                      on_done=show_saved_database)
+        return
+    if journal is not None and same_file(file_path, journal.project_path):
+        journal.compact(store.copy())
+        messagebox.showinfo("Save Successful", "Project saved successfully")
+        return
+
+    # Edits stop going to the journal of the previous project file
+    close_project()
+    if is_sqlite_project(file_path):
+        open_database(SqliteProject.create(file_path, store))
+    else:
+        save_project_file(store, file_path)
+        if is_binary_project(file_path):
+            start_journal(file_path)
+    messagebox.showinfo("Save Successful", "Project saved successfully")
+
+
+# Background job: copy every marker of a SQLite project into a new project file. Returns the
+# file path and, for a binary project, the markers to continue with.
+def save_database_job(job, database_path, file_path):
+    project = SqliteProject(database_path)
+    try:
+        if is_sqlite_project(file_path):
+            project.copy_to(file_path)
+            return file_path, None
+        if not is_binary_project(file_path):
+            project.to_csv(file_path)
+            return file_path, None
+        markers = gather_batches(job, project.iter_batches(), len(project))
+    finally:
+        project.close()
+    save_project_file(markers, file_path)
+    return file_path, markers
+
+
+# Function to continue in a project file written by save_database_job (runs on the Tk thread).
+# A CSV copy cannot be edited in place, so the SQLite project stays open after one.
+def show_saved_database(result):
+    global store
+    file_path, markers = result
+    if is_sqlite_project(file_path):
+        close_project()
+        open_database(SqliteProject(file_path))
+    elif markers is not None:
+        start_journal(file_path)
+        store = markers
+        clear_list()
+        list_rows_from(0)
+    messagebox.showinfo("Save Successful", "Project saved successfully")
+
+
+def same_file(path, other_path):
+    return os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(other_path))
+
+
+# Function to export the markers as CSV
+def export_csv():
+    file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+    if file_path:
+        if database is not None:
+            database.to_csv(file_path)
+        else:
+            save_csv_project(store, file_path)
+        messagebox.showinfo("Export Successful", "Markers exported to CSV successfully")
+
+
+# Function to close the open journal or database before switching projects
+def close_project():
+    global journal, database
+    if journal is not None:
+        journal.close()
+        journal = None
+    if database is not None:
+        database.close()
+        database = None
+
+
+# Function to switch to a SQLite project, showing the first LIST_LIMIT markers
+def open_database(project):
+    global database, store
+    database = project
+    store = database.head(LIST_LIMIT)
+    clear_list()
+    list_rows_from(0)
+
+
+# Function to start journaling edits to a binary project, replacing any previous journal
+def start_journal(file_path):
+    global journal
+    close_project()
+    for stale_path in (file_path + '.journal', file_path + '.journal.compacting'):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    journal = ProjectJournal(file_path)
+
+
+# Function to fold a long journal into a new snapshot
+def compact_journal_if_needed():
+    if journal is not None and journal.needs_compaction:
+        journal.compact(store.copy())
+
+
+# Function to load project from a binary project file or a CSV file
 def load_project():
-    file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+    file_path = filedialog.askopenfilename(filetypes=PROJECT_FILETYPES)
     if file_path:
-        global df
-        df = pd.read_csv(file_path)
-        coordinates_listbox.delete(0, tk.END)
-        for index, row in df.iterrows():
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row['Icon']}")
+        if is_sqlite_project(file_path):
+            # Opening a database only reads the markers shown in the list
+            close_project()
+            open_database(SqliteProject(file_path))
+        else:
+            start_job("Loading project...", read_project_job, file_path, on_done=show_loaded_project)
+
+
+# Background job: parse a project file into a new, not yet visible marker store
+def read_project_job(job, file_path):
+    if is_binary_project(file_path):
+        return file_path, open_project(file_path), None
+    return file_path, *load_project_file(file_path)
+
+
+# Function to replace the current markers with a loaded project (runs on the Tk thread)
+def show_loaded_project(result):
+    global store, journal
+    file_path, store, report = result
+    close_project()
+    if is_binary_project(file_path):
+        journal = ProjectJournal(file_path)
+    clear_list()
+    list_rows_from(0)
+    show_validation_report(report)
+
+
+# Function to run a long operation in the background with the progress bar and Cancel button
+def start_job(message, func, *args, on_done=None, on_progress=None):
+    if jobs.busy:
+        messagebox.showerror("Busy", "Please wait for the current operation to finish or cancel it")
+        return
+
+    def finished(result):
+        hide_progress()
+        if on_done is not None:
+            on_done(result)
+
+    def failed(error):
+        hide_progress()
+        messagebox.showerror("Error", str(error))
+
+    status_var.set(message)
+    progress_bar['value'] = 0
+    cancel_btn.state(['!disabled'])
+    jobs.submit(func, *args, on_done=finished, on_progress=on_progress or show_progress,
+                on_error=failed, on_cancel=lambda: (hide_progress(), status_var.set("Cancelled")))
+
+
+# Function to update the progress bar
+def show_progress(done, total, *payload):
+    progress_bar['maximum'] = max(total, 1)
+    progress_bar['value'] = done
+
+
+def hide_progress():
+    progress_bar['value'] = 0
+    status_var.set("")
+    cancel_btn.state(['disabled'])
+
+
+# Function to close the app, stopping any background job first
+def on_close():
+    jobs.shutdown()
+    close_project()
+    stop_servers()
+    if marker_server is not None:
+        marker_server.close()
+    root.destroy()
 
 
 # Function to pick a color
@@ -124,111 +537,173 @@ def pick_color():
 
 # Function to edit an existing marker
 def edit_marker(event):
-    selected_index = coordinates_listbox.curselection()
-    if selected_index:
-        index = selected_index[0]
-        selected_marker = df.iloc[index]
+    position, row = selected_marker()
+    if row is not None:
+        marker = store.row(row)
         name_entry.delete(0, tk.END)
-        name_entry.insert(tk.END, selected_marker['Label'])
+        name_entry.insert(tk.END, marker['Label'])
         color_entry.delete(0, tk.END)
-        color_entry.insert(tk.END, selected_marker['Color'])
+        color_entry.insert(tk.END, marker['Color'])
         lat_entry.delete(0, tk.END)
-        lat_entry.insert(tk.END, selected_marker['Latitude'])
+        lat_entry.insert(tk.END, marker['Latitude'])
         lon_entry.delete(0, tk.END)
-        lon_entry.insert(tk.END, selected_marker['Longitude'])
-        icon_var.set(selected_marker['Icon'])
+        lon_entry.insert(tk.END, marker['Longitude'])
+        icon_var.set(marker['Icon'])
 
 
 # Function to search for markers
 def search_markers():
+    global store
     query = search_entry.get().lower()
+    clear_list()
+    if database is not None:
+        # The list shows the matching markers fetched from the database
+        store = database.search(query, LIST_LIMIT)
+        list_rows_from(0)
+        return
+    rows = [row for row, (latitude, longitude, label, color, icon) in enumerate(store.iter_rows())
+            if query in label.lower() or query in color.lower() or query in str(latitude) or query in str(longitude)]
+    coordinates_listbox.insert(tk.END, *[store.describe(row) for row in rows])
+    listed_ids.extend(store.marker_id(row) for row in rows)
+
+
+# Function to return (list position, store row) of the selected marker, or (None, None)
+def selected_marker():
+    selected_index = coordinates_listbox.curselection()
+    if not selected_index:
+        return None, None
+    position = selected_index[0]
+    return position, store.row_of(listed_ids[position])
+
+
+# Function to append the store rows from `start` on to the list
+def list_rows_from(start):
+    coordinates_listbox.insert(tk.END, *store.describe_rows(start))
+    listed_ids.extend(store.ids[start:].tolist())
+
+
+def clear_list():
     coordinates_listbox.delete(0, tk.END)
-    for index, row in df.iterrows():
-        if query in row['Label'].lower() or query in row['Color'].lower() or query in str(
-                row['Latitude']) or query in str(row['Longitude']):
-            coordinates_listbox.insert(tk.END,
-                                       f"{row['Label']} ({row['Latitude']}, {row['Longitude']}) - {row['Color']} - {row['Icon']}")
-
-
-# Initialize the main application window
-root = tk.Tk()
-root.title("Map Marker Tool")
-root.geometry("700x500")
-
-# Create a style for the UI
-style = ttk.Style(root)
-style.theme_use('clam')
-
-# Main frame
-main_frame = ttk.Frame(root, padding="10 10 10 10")
-main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-
-# Make the grid cells resizable
-root.grid_rowconfigure(0, weight=1)
-root.grid_columnconfigure(0, weight=1)
-main_frame.grid_rowconfigure(7, weight=1)
-main_frame.grid_columnconfigure(1, weight=1)
-
-# Labels and Entries for marker details
-ttk.Label(main_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
-name_entry = ttk.Entry(main_frame)
-name_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-
-ttk.Label(main_frame, text="Color:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
-color_entry = ttk.Entry(main_frame)
-color_entry.grid(row=1, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-color_picker_btn = ttk.Button(main_frame, text="Pick Color", command=pick_color)
-color_picker_btn.grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
-
-ttk.Label(main_frame, text="Latitude:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
-lat_entry = ttk.Entry(main_frame)
-lat_entry.grid(row=2, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-
-ttk.Label(main_frame, text="Longitude:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
-lon_entry = ttk.Entry(main_frame)
-lon_entry.grid(row=3, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-
-# Icon selection
-ttk.Label(main_frame, text="Icon:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
-icon_var = tk.StringVar()
-icon_menu = ttk.Combobox(main_frame, textvariable=icon_var)
-icon_menu['values'] = ('info-sign', 'cloud', 'home', 'flag', 'star')
-icon_menu.current(0)
-icon_menu.grid(row=4, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-
-# Add marker button
-add_marker_btn = ttk.Button(main_frame, text="Add/Update Marker", command=add_marker)
-add_marker_btn.grid(row=5, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
-
-# Listbox to display the coordinates and associated information
-coordinates_listbox = tk.Listbox(main_frame)
-coordinates_listbox.grid(row=6, column=0, columnspan=3, padx=5, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
-coordinates_listbox.bind('<Double-1>', edit_marker)
-
-# Search functionality
-ttk.Label(main_frame, text="Search:").grid(row=7, column=0, padx=5, pady=5, sticky=tk.W)
-search_entry = ttk.Entry(main_frame)
-search_entry.grid(row=7, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
-search_button = ttk.Button(main_frame, text="Search", command=search_markers)
-search_button.grid(row=7, column=2, padx=5, pady=5, sticky=tk.W)
-
-# Button to delete a marker
-delete_marker_btn = ttk.Button(main_frame, text="Delete Marker", command=delete_marker)
-delete_marker_btn.grid(row=8, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
-
-# Buttons to create the map and save/load projects
-create_map_btn = ttk.Button(main_frame, text="Create Map", command=create_map)
-create_map_btn.grid(row=9, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
-
-save_project_btn = ttk.Button(main_frame, text="Save Project", command=save_project)
-save_project_btn.grid(row=10, column=0, pady=10, sticky=(tk.W, tk.E))
-
-load_project_btn = ttk.Button(main_frame, text="Load Project", command=load_project)
-load_project_btn.grid(row=10, column=1, pady=10, sticky=(tk.W, tk.E))
-
-# Button to load data from Excel
-load_excel_btn = ttk.Button(main_frame, text="Load from Excel", command=load_from_excel)
-load_excel_btn.grid(row=11, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
-
-# Start the Tkinter event loop
-root.mainloop()
+    listed_ids.clear()
+
+
+# The window is only built when the tool is run, not when the worker processes of the split
+# maps start by importing this script again (as they do on Windows and macOS)
+if __name__ == '__main__':
+    # Initialize the main application window
+    root = tk.Tk()
+    root.title("Map Marker Tool")
+    root.geometry("700x650")
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    jobs = JobRunner(root)
+
+    # Create a style for the UI
+    style = ttk.Style(root)
+    style.theme_use('clam')
+
+    # Main frame
+    main_frame = ttk.Frame(root, padding="10 10 10 10")
+    main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+    # Make the grid cells resizable
+    root.grid_rowconfigure(0, weight=1)
+    root.grid_columnconfigure(0, weight=1)
+    main_frame.grid_rowconfigure(7, weight=1)
+    main_frame.grid_columnconfigure(1, weight=1)
+
+    # Labels and Entries for marker details
+    ttk.Label(main_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+    name_entry = ttk.Entry(main_frame)
+    name_entry.grid(row=0, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+    ttk.Label(main_frame, text="Color:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+    color_entry = ttk.Entry(main_frame)
+    color_entry.grid(row=1, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+    color_picker_btn = ttk.Button(main_frame, text="Pick Color", command=pick_color)
+    color_picker_btn.grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
+
+    ttk.Label(main_frame, text="Latitude:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+    lat_entry = ttk.Entry(main_frame)
+    lat_entry.grid(row=2, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+    ttk.Label(main_frame, text="Longitude:").grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
+    lon_entry = ttk.Entry(main_frame)
+    lon_entry.grid(row=3, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+    # Icon selection
+    ttk.Label(main_frame, text="Icon:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+    icon_var = tk.StringVar()
+    icon_menu = ttk.Combobox(main_frame, textvariable=icon_var)
+    icon_menu['values'] = ICON_NAMES
+    icon_menu.current(0)
+    icon_menu.grid(row=4, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+    # Add marker button
+    add_marker_btn = ttk.Button(main_frame, text="Add/Update Marker", command=add_marker)
+    add_marker_btn.grid(row=5, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+
+    # Listbox to display the coordinates and associated information
+    coordinates_listbox = tk.Listbox(main_frame)
+    coordinates_listbox.grid(row=6, column=0, columnspan=3, padx=5, pady=5, sticky=(tk.W, tk.E, tk.N, tk.S))
+    coordinates_listbox.bind('<Double-1>', edit_marker)
+
+    # Search functionality
+    ttk.Label(main_frame, text="Search:").grid(row=7, column=0, padx=5, pady=5, sticky=tk.W)
+    search_entry = ttk.Entry(main_frame)
+    search_entry.grid(row=7, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+    search_button = ttk.Button(main_frame, text="Search", command=search_markers)
+    search_button.grid(row=7, column=2, padx=5, pady=5, sticky=tk.W)
+
+    # Button to delete a marker
+    delete_marker_btn = ttk.Button(main_frame, text="Delete Marker", command=delete_marker)
+    delete_marker_btn.grid(row=8, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+
+    serve_map_btn = ttk.Button(main_frame, text="Serve Map", command=serve_map)
+    serve_map_btn.grid(row=8, column=2, pady=10, sticky=(tk.W, tk.E))
+
+    # Buttons to create the map and save/load projects
+    create_map_btn = ttk.Button(main_frame, text="Create Map", command=create_map)
+    create_map_btn.grid(row=9, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+    render_mode_var = tk.StringVar(value=RENDER_MODES[0])
+    render_mode_menu = ttk.Combobox(main_frame, textvariable=render_mode_var, values=RENDER_MODES,
+                                    state='readonly', width=10)
+    render_mode_menu.grid(row=9, column=2, padx=5, pady=10, sticky=tk.W)
+
+    save_project_btn = ttk.Button(main_frame, text="Save Project", command=save_project)
+    save_project_btn.grid(row=10, column=0, pady=10, sticky=(tk.W, tk.E))
+
+    load_project_btn = ttk.Button(main_frame, text="Load Project", command=load_project)
+    load_project_btn.grid(row=10, column=1, pady=10, sticky=(tk.W, tk.E))
+
+    export_csv_btn = ttk.Button(main_frame, text="Export CSV", command=export_csv)
+    export_csv_btn.grid(row=10, column=2, pady=10, sticky=(tk.W, tk.E))
+
+    save_project_as_btn = ttk.Button(main_frame, text="Save Project As...", command=save_project_as)
+    save_project_as_btn.grid(row=13, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+
+    # Button to load data from Excel
+    load_excel_btn = ttk.Button(main_frame, text="Load from Excel", command=load_from_excel)
+    load_excel_btn.grid(row=11, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+
+    export_tiles_btn = ttk.Button(main_frame, text="Export Tiles", command=export_tiles)
+    export_tiles_btn.grid(row=11, column=2, pady=10, sticky=(tk.W, tk.E))
+
+    # Button to create one map per color or icon group
+    create_split_maps_btn = ttk.Button(main_frame, text="Create Split Maps", command=create_split_maps)
+    create_split_maps_btn.grid(row=12, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E))
+    split_column_var = tk.StringVar(value=SPLIT_COLUMNS[0])
+    split_column_menu = ttk.Combobox(main_frame, textvariable=split_column_var, values=SPLIT_COLUMNS,
+                                     state='readonly', width=10)
+    split_column_menu.grid(row=12, column=2, padx=5, pady=10, sticky=tk.W)
+
+    # Progress of background operations
+    status_var = tk.StringVar()
+    ttk.Label(main_frame, textvariable=status_var).grid(row=14, column=0, padx=5, pady=5, sticky=tk.W)
+    progress_bar = ttk.Progressbar(main_frame, mode='determinate')
+    progress_bar.grid(row=14, column=1, padx=5, pady=5, sticky=(tk.W, tk.E))
+    cancel_btn = ttk.Button(main_frame, text="Cancel", command=jobs.cancel)
+    cancel_btn.grid(row=14, column=2, padx=5, pady=5, sticky=tk.W)
+    cancel_btn.state(['disabled'])
+
+    # Start the Tkinter event loop
+    root.mainloop()
@@ -0,0 +1,105 @@
+import os
+
+import folium
+
+from marker_store import MarkerStore
+from renderers import (CircleMarkers, DensityCells, ExternalDataMarkers, GeoJsonMarkers, IconTable,
+                       LevelOfDetailMarkers, SharedIconMarker, VectorTileMarkers, ZoomClusterLayer, marker_colors)
+from cluster_index import ClusterIndex
+from density import DensityGrid
+from lod import detail_zooms, priority_mask
+from vector_tiles import LAYER_NAME, MAX_ZOOM, MIN_ZOOM, vector_tiles, write_tile_directory
+
+MAP_ZOOM_START = 12
+# Render jobs report progress (and check for Cancel) every this many markers
+PROGRESS_EVERY = 1000
+# Compressed marker data written next to the map in the 'external' render mode
+DATA_FILE_SUFFIX = '.data.js'
+# Vector tile folder written next to the map in the 'vector' render mode
+TILE_DIR_SUFFIX = '_tiles'
+
+
+# Build the folium map of the marker batches in `render_mode` (see RENDER_MODES) and save
+# it. With a RenderCache the GeoJSON modes reuse the features of unchanged marker chunks.
+def build_map(job, batches, total, initial_location, output_map_file, render_mode='markers', cache=None):
+    # Circles and density cells are drawn on one canvas instead of as an SVG element each
+    mymap = folium.Map(location=initial_location, zoom_start=MAP_ZOOM_START,
+                       prefer_canvas=render_mode in ('circles', 'density'))
+
+    index = 0
+    if render_mode in ('geojson', 'cluster'):
+        # All markers go into one GeoJSON layer, built a whole batch at a time
+        layer = GeoJsonMarkers(cluster=render_mode == 'cluster',
+                               style_table=cache.style_table if cache is not None else None)
+        for batch in batches:
+            job.check_cancelled()
+            layer.add_store(batch, cache=cache)
+            index += len(batch)
+            job.report(index, total)
+        layer.add_to(mymap)
+    elif render_mode == 'indexed':
+        # The cluster index needs every position at once
+        markers = gather_batches(job, batches, total)
+        ZoomClusterLayer(markers, ClusterIndex(markers.latitudes, markers.longitudes)).add_to(mymap)
+    elif render_mode == 'external':
+        # The page only gets a loader; the markers go to a compressed file next to it
+        markers = gather_batches(job, batches, total)
+        data_path = os.path.splitext(output_map_file)[0] + DATA_FILE_SUFFIX
+        layer = ExternalDataMarkers(os.path.basename(data_path))
+        layer.write_data(markers, data_path)
+        layer.add_to(mymap)
+    elif render_mode == 'circles':
+        # No icons: one canvas circle per marker in the marker's color
+        markers = gather_batches(job, batches, total)
+        CircleMarkers(markers).add_to(mymap)
+    elif render_mode == 'density':
+        # Only the marker counts of the non-empty grid cells go into the page
+        markers = gather_batches(job, batches, total)
+        DensityCells(DensityGrid(markers.latitudes, markers.longitudes)).add_to(mymap)
+    elif render_mode == 'lod':
+        # Each marker is shown from the zoom level where grid thinning first keeps it
+        markers = gather_batches(job, batches, total)
+        zooms = detail_zooms(markers.latitudes, markers.longitudes, priority_mask(markers))
+        LevelOfDetailMarkers(markers, zooms).add_to(mymap)
+    elif render_mode == 'vector':
+        # The page only gets a vector tile layer; the markers go to a tile folder next to it
+        markers = gather_batches(job, batches, total)
+        tile_dir = os.path.splitext(output_map_file)[0] + TILE_DIR_SUFFIX
+        write_tile_directory(tracked_tiles(job, vector_tiles(markers, marker_colors(markers))), tile_dir)
+        VectorTileMarkers(os.path.basename(tile_dir) + '/{z}/{x}/{y}.pbf', LAYER_NAME, MAX_ZOOM).add_to(mymap)
+    else:
+        # Icons are defined once per (color, icon) pair and shared by the markers
+        icon_table = IconTable()
+        icon_table.add_to(mymap)
+        for batch in batches:
+            styles = icon_table.style_table.codes(batch).tolist()
+            for (latitude, longitude, label, color, icon), style in zip(batch.iter_rows(), styles):
+                SharedIconMarker([latitude, longitude], icon_table, style, label=label).add_to(mymap)
+                if index % PROGRESS_EVERY == 0:
+                    job.check_cancelled()
+                    job.report(index, total)
+                index += 1
+
+    mymap.save(output_map_file)
+    return output_map_file
+
+
+# Collect the batches of a render job into one store
+def gather_batches(job, batches, total):
+    markers = MarkerStore(capacity=total)
+    for batch in batches:
+        job.check_cancelled()
+        markers.extend_store(batch)
+        job.report(len(markers), total)
+    return markers
+
+
+# Pass tiles from vector_tiles() through, checking for Cancel and reporting each zoom level
+def tracked_tiles(job, tiles):
+    zoom = None
+    for tile in tiles:
+        job.check_cancelled()
+        if tile[0] != zoom:
+            zoom = tile[0]
+            job.report(zoom - MIN_ZOOM, MAX_ZOOM - MIN_ZOOM + 1)
+        yield tile
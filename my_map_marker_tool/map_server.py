@@ -0,0 +1,283 @@
+import functools
+import json
+import os
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import folium
+import numpy as np
+
+from renderers import COORDINATE_DECIMALS, StyleTable, ViewportMarkers, json_labels
+from sqlite_store import SqliteProject
+from viewport_index import MAX_RESULTS, MAX_ZOOM, THIN_PIXELS, ViewportIndex
+from cluster_index import TILE_SIZE
+
+# Open event streams send a comment this often, so pages that were closed are noticed
+KEEPALIVE_SECONDS = 15
+
+# Local HTTP servers by served directory. Pages that fetch files next to them (vector tiles)
+# do not work when opened from file://, so such maps are opened through one of these.
+_servers = {}
+
+
+# Serve the files of `directory` on a free localhost port from a background thread and
+# return the base URL. The server is started once per directory and kept until stop_servers().
+def serve_directory(directory):
+    directory = os.path.abspath(directory)
+    server = _servers.get(directory)
+    if server is None:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=directory))
+        threading.Thread(target=server.serve_forever, name='map-server', daemon=True).start()
+        _servers[directory] = server
+    return f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def stop_servers():
+    for server in _servers.values():
+        server.shutdown()
+        server.server_close()
+    _servers.clear()
+
+
+# Local HTTP server that lets the browser page through a marker store by viewport, with live
+# edits pushed to the open pages.
+#
+#   GET /                                               the map page (tiles and a ViewportMarkers layer)
+#   GET /markers?bbox=south,west,north,east&zoom=z      the markers to draw there, as
+#                                                       [[latitude, longitude, label, style, id], ...]
+#   GET /events                                         server-sent events with marker changes
+#
+# Queries are answered from a ViewportIndex of a store snapshot, or straight from a SQLite
+# project through its R*Tree (see load_database), so the browser only ever receives the
+# thinned markers of the area in view. Edits made after the snapshot go to an
+# overlay by marker id: put_marker/remove_marker push just the changed marker to every open
+# page and later queries see the overlay instead of the snapshot rows. load() swaps in a new
+# snapshot and makes the open pages reload, so one tab stays open however often it is called.
+# Build snapshots in a background job, as indexing a large store takes a moment.
+class MarkerServer:
+    # `markers` is a MarkerStore snapshot, or the path of a SQLite project to serve from disk
+    def __init__(self, markers, location, zoom_start):
+        self._lock = threading.Lock()
+        self._subscribers = []
+        # marker id -> (edit sequence number, [latitude, longitude, label, style, id] or None if removed)
+        self._edits = {}
+        self.edit_sequence = 0
+        if isinstance(markers, str):
+            self.load_database(markers, location, zoom_start)
+        else:
+            self.load(markers, location, zoom_start)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _MarkerRequestHandler)
+        self._server.markers = self
+        threading.Thread(target=self._server.serve_forever, name='marker-server', daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/'
+
+    # Number of pages connected for live updates
+    @property
+    def viewers(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    # Serve a new snapshot of the markers. Edits numbered up to `edits_before` (the
+    # edit_sequence when the snapshot was taken) are part of it and leave the overlay.
+    def load(self, store, location, zoom_start, edits_before=None):
+        style_table = StyleTable()
+        self._switch(_SnapshotMarkers(store, style_table), style_table, location, zoom_start, edits_before)
+
+    # Serve the markers of a SQLite project without loading them: every query reads the
+    # markers in view through the project's R*Tree index. Edits written to the project show
+    # up in later queries by themselves; `edits_before` is as for load().
+    def load_database(self, database_path, location, zoom_start, edits_before=None):
+        style_table = StyleTable()
+        self._switch(_DatabaseMarkers(database_path, style_table, self._lock), style_table, location, zoom_start,
+                     edits_before)
+
+    # JSON array of the markers to draw in a lat/lon box at `zoom`
+    def markers_json(self, south, west, north, east, zoom):
+        with self._lock:
+            source = self._source
+        # Outside the lock, so a slow database query does not hold up live edits
+        found = list(source.query(south, west, north, east, zoom))
+        with self._lock:
+            points = [
+                f'[{latitude},{longitude},{label},{style},{marker_id}]'
+                for latitude, longitude, label, style, marker_id in found if marker_id not in self._edits]
+            points.extend(json.dumps(marker) for _, marker in self._edits.values()
+                          if marker is not None and south <= marker[0] <= north and west <= marker[1] <= east)
+        return '[' + ','.join(points) + ']'
+
+    # Add or change a marker live
+    def put_marker(self, marker_id, latitude, longitude, label, color, icon):
+        with self._lock:
+            style_count = len(self._style_table)
+            marker = [round(latitude, COORDINATE_DECIMALS), round(longitude, COORDINATE_DECIMALS), label,
+                      self._style_table.index(color, icon), int(marker_id)]
+            self.edit_sequence += 1
+            self._edits[marker[4]] = (self.edit_sequence, marker)
+            event = {'type': 'put', 'marker': marker}
+            if len(self._style_table) > style_count:
+                event['styles'] = self._style_table.styles
+            message = json.dumps(event)
+        self._broadcast(message)
+
+    # Remove a marker live
+    def remove_marker(self, marker_id):
+        with self._lock:
+            self.edit_sequence += 1
+            self._edits[int(marker_id)] = (self.edit_sequence, None)
+        self._broadcast(json.dumps({'type': 'remove', 'id': int(marker_id)}))
+
+    def subscribe(self):
+        events = queue.Queue()
+        with self._lock:
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def close(self):
+        # None ends the event streams, so shutdown() does not wait on open pages
+        self._broadcast(None)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _switch(self, source, style_table, location, zoom_start, edits_before):
+        mymap = folium.Map(location=location, zoom_start=zoom_start)
+        ViewportMarkers('markers', 'events', style_table).add_to(mymap)
+        page = mymap.get_root().render().encode('utf-8')
+
+        with self._lock:
+            self._source, self._style_table, self.page = source, style_table, page
+            if edits_before is not None:
+                self._edits = {marker_id: edit for marker_id, edit in self._edits.items() if edit[0] > edits_before}
+        self._broadcast('{"type":"reload"}')
+
+    def _broadcast(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            events.put(message)
+
+
+# Markers of a store snapshot, thinned per zoom level by a ViewportIndex
+class _SnapshotMarkers:
+    def __init__(self, store, style_table):
+        self.index = ViewportIndex(store)
+        self._styles = style_table.codes(store)
+        self._ids = np.asarray(store.ids)
+        self._labels = json_labels(store)
+        self._latitudes = np.round(store.latitudes, COORDINATE_DECIMALS)
+        self._longitudes = np.round(store.longitudes, COORDINATE_DECIMALS)
+
+    # (latitude, longitude, JSON label, style, id) of the markers to draw in a box at `zoom`
+    def query(self, south, west, north, east, zoom):
+        rows = self.index.query(south, west, north, east, zoom)
+        return zip(self._latitudes[rows].tolist(), self._longitudes[rows].tolist(), self._labels[rows].tolist(),
+                   self._styles[rows].tolist(), self._ids[rows].tolist())
+
+
+# Markers read from a SQLite project per query. Below MAX_ZOOM the query keeps one marker per
+# THIN_PIXELS square of the view (the database groups them by a lat/lon grid that is square on
+# screen at the view's latitude), and never more than MAX_RESULTS, so only what fits on the
+# screen leaves the database. Every query opens its own connection, as requests are answered
+# on different threads. `lock` guards the style table, which live edits add to.
+class _DatabaseMarkers:
+    def __init__(self, database_path, style_table, lock):
+        self.database_path = database_path
+        self.style_table = style_table
+        self._lock = lock
+        project = SqliteProject(database_path)
+        try:
+            for color, icon in project.styles():
+                style_table.index(color, icon)
+        finally:
+            project.close()
+
+    # (latitude, longitude, JSON label, style, id) of the markers to draw in a box at `zoom`
+    def query(self, south, west, north, east, zoom):
+        cell = None
+        if zoom < MAX_ZOOM:
+            longitude_step = THIN_PIXELS * 360 / (TILE_SIZE * 2 ** zoom)
+            latitude_step = longitude_step * np.cos(np.radians((south + north) / 2))
+            cell = (latitude_step, longitude_step)
+        project = SqliteProject(self.database_path)
+        try:
+            markers = project.in_bbox(south, west, north, east, limit=MAX_RESULTS, cell=cell)
+        finally:
+            project.close()
+        with self._lock:
+            styles = self.style_table.codes(markers)
+        return zip(np.round(markers.latitudes, COORDINATE_DECIMALS).tolist(),
+                   np.round(markers.longitudes, COORDINATE_DECIMALS).tolist(), json_labels(markers).tolist(),
+                   styles.tolist(), markers.ids.tolist())
+
+
+class _MarkerRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/':
+            self._send(200, 'text/html; charset=utf-8', self.server.markers.page)
+        elif url.path == '/markers':
+            try:
+                query = parse_qs(url.query)
+                south, west, north, east = (float(value) for value in query['bbox'][0].split(','))
+                zoom = int(query['zoom'][0])
+            except (KeyError, ValueError):
+                self._send(400, 'text/plain; charset=utf-8', b'Expected ?bbox=south,west,north,east&zoom=z')
+                return
+            body = self.server.markers.markers_json(south, west, north, east, zoom)
+            self._send(200, 'application/json', body.encode('utf-8'))
+        elif url.path == '/events':
+            self._stream_events()
+        else:
+            self._send(404, 'text/plain; charset=utf-8', b'Not found')
+
+    # Hold the connection open and write every broadcast message as a server-sent event
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        events = self.server.markers.subscribe()
+        try:
+            while True:
+                try:
+                    message = events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment lines keep the connection alive and notice closed pages
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                if message is None:
+                    break
+                self.wfile.write(f'data: {message}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.markers.unsubscribe(events)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Static file handler that does not log every tile request to the console
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
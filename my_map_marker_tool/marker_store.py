@@ -0,0 +1,332 @@
+import numpy as np
+import pandas as pd
+
+# Column layout shared by the GUI, the project files and the map renderers
+COLUMNS = ['Latitude', 'Longitude', 'Label', 'Color', 'Icon']
+STRING_COLUMNS = ['Label', 'Color', 'Icon']
+DEFAULT_ICON = 'info-sign'
+
+
+# Dictionary of the distinct values of one string column. Rows store an int32 code that
+# indexes `values`; the same code always means the same string.
+class Categories:
+    def __init__(self, values=()):
+        self.values = []
+        self._codes = {}
+        for value in values:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    # Code of a value, adding it to the dictionary if it is new
+    def code(self, value):
+        value = _as_text(value)
+        codes = self._lookup()
+        code = codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            codes[value] = code
+        return code
+
+    # Code of a value already in the dictionary, or None
+    def find(self, value):
+        return self._lookup().get(value)
+
+    # Codes for a whole sequence, looking up each distinct value only once
+    def encode(self, values):
+        series = pd.Series(values, dtype=object)
+        local_codes, uniques = pd.factorize(series.fillna('nan'), sort=False)
+        return self.remap(uniques)[local_codes]
+
+    # Array translating codes of another dictionary (given as its list of distinct values)
+    # into codes of this one
+    def remap(self, values):
+        if not self.values:
+            # Nothing to merge with: take the other dictionary over as it is. The value -> code
+            # lookup is only built if it is needed later, which keeps project loads cheap.
+            self.values = [_as_text(value) for value in values]
+            self._codes = None
+            return np.arange(len(self.values), dtype=np.int32)
+        return np.array([self.code(value) for value in values], dtype=np.int32)
+
+    def decode(self, codes):
+        if len(codes) < len(self.values):
+            # Few rows against a big dictionary (e.g. unique labels): index the list directly
+            values = self.values
+            return [values[code] for code in codes.tolist()]
+        return np.array(self.values, dtype=object)[codes].tolist()
+
+    def _lookup(self):
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self.values)}
+        return self._codes
+
+
+# Column-oriented marker storage.
+#
+# Latitude/longitude live in NumPy arrays that double their capacity when full, so
+# appends are amortized O(1) instead of re-allocating a DataFrame for every row.
+# Label, color and icon are categorical: each row holds an int32 code into a shared
+# dictionary of distinct strings, so a million markers with a handful of colors and
+# icons cost a few bytes per row, and filters/group-bys on them are integer operations.
+# A DataFrame is only built when `to_dataframe()` is called.
+#
+# Every marker also gets a stable integer id that survives edits, deletes and project
+# save/load, so journals, the list widget and other references can name a marker
+# independent of its row. An id -> row dict makes lookups by id O(1), and deletes move the
+# last row into the freed slot, so row order is not preserved across deletes.
+class MarkerStore:
+    def __init__(self, capacity=1024):
+        capacity = max(int(capacity), 1)
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._lon = np.empty(capacity, dtype=np.float64)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._codes = {column: np.empty(capacity, dtype=np.int32) for column in STRING_COLUMNS}
+        self._categories = {column: Categories() for column in STRING_COLUMNS}
+        self._size = 0
+        self._next_id = 1
+        self._rows_by_id = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def latitudes(self):
+        return self._lat[:self._size]
+
+    @property
+    def longitudes(self):
+        return self._lon[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def next_id(self):
+        return self._next_id
+
+    # int32 codes of a string column ('Label', 'Color' or 'Icon')
+    def codes(self, column):
+        return self._codes[column][:self._size]
+
+    # Distinct values of a string column, indexed by code
+    def categories(self, column):
+        return self._categories[column].values
+
+    # Decoded values of a string column as a list
+    def values(self, column):
+        return self._categories[column].decode(self.codes(column))
+
+    # Rows whose string column equals `value`, without comparing any strings per row
+    def rows_where(self, column, value):
+        code = self._categories[column].find(value)
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero(self.codes(column) == code)
+
+    # Number of markers per value of a string column, as a {value: count} dict
+    def count_by(self, column):
+        counts = np.bincount(self.codes(column), minlength=len(self._categories[column]))
+        return {value: int(count) for value, count in zip(self.categories(column), counts) if count}
+
+    # Make sure there is room for `extra` more rows, doubling the arrays if needed
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._lat)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._lat = _grown(self._lat, self._size, capacity)
+        self._lon = _grown(self._lon, self._size, capacity)
+        self._ids = _grown(self._ids, self._size, capacity)
+        for column in STRING_COLUMNS:
+            self._codes[column] = _grown(self._codes[column], self._size, capacity)
+
+    # Add a single marker and return its row number. A new id is assigned unless
+    # `marker_id` is given (e.g. when replaying a journal).
+    def append(self, latitude, longitude, label, color, icon=DEFAULT_ICON, marker_id=None):
+        marker_id = self._next_id if marker_id is None else int(marker_id)
+        self._reserve(1)
+        row = self._size
+        self._lat[row] = latitude
+        self._lon[row] = longitude
+        self._ids[row] = marker_id
+        self._set_strings(row, label, color, icon)
+        self._rows_by_id[marker_id] = row
+        self._next_id = max(self._next_id, marker_id + 1)
+        self._size += 1
+        return row
+
+    # Add many markers at once from equally sized sequences. Pass `ids` to keep existing
+    # marker ids instead of assigning new ones.
+    def extend(self, latitudes, longitudes, labels, colors, icons, ids=None):
+        codes = {
+            'Label': self._categories['Label'].encode(labels),
+            'Color': self._categories['Color'].encode(colors),
+            'Icon': self._categories['Icon'].encode(icons),
+        }
+        self._extend(latitudes, longitudes, codes, ids)
+
+    # Add many markers given as codes into other dictionaries, e.g. straight from a project
+    # file or another store. `categories` maps each string column to its list of values.
+    def extend_coded(self, latitudes, longitudes, codes, categories, ids=None):
+        remapped = {}
+        for column in STRING_COLUMNS:
+            column_codes = np.asarray(codes[column])
+            if len(column_codes) == 0:
+                remapped[column] = column_codes.astype(np.int32)
+            else:
+                remapped[column] = self._categories[column].remap(categories[column])[column_codes]
+        self._extend(latitudes, longitudes, remapped, ids)
+
+    # Add every marker of another store, keeping its ids
+    def extend_store(self, other):
+        self.extend_coded(other.latitudes, other.longitudes,
+                          {column: other.codes(column) for column in STRING_COLUMNS},
+                          {column: other.categories(column) for column in STRING_COLUMNS},
+                          ids=other.ids)
+
+    def _extend(self, latitudes, longitudes, codes, ids):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        count = len(latitudes)
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+        self._reserve(count)
+        start = self._size
+        self._lat[start:start + count] = latitudes
+        self._lon[start:start + count] = longitudes
+        self._ids[start:start + count] = ids
+        for column in STRING_COLUMNS:
+            self._codes[column][start:start + count] = codes[column]
+        if count:
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+            self._rows_by_id.update(zip(ids.tolist(), range(start, start + count)))
+        self._size += count
+
+    # Overwrite an existing marker in place
+    def update(self, row, latitude, longitude, label, color, icon=DEFAULT_ICON):
+        self._check_row(row)
+        self._lat[row] = latitude
+        self._lon[row] = longitude
+        self._set_strings(row, label, color, icon)
+
+    # Remove a marker in O(1) by moving the last row into its slot
+    def delete(self, row):
+        self._check_row(row)
+        last = self._size - 1
+        del self._rows_by_id[int(self._ids[row])]
+        if row != last:
+            for array in (self._lat, self._lon, self._ids, *self._codes.values()):
+                array[row] = array[last]
+            self._rows_by_id[int(self._ids[row])] = row
+        self._size = last
+
+    def clear(self):
+        self._size = 0
+        self._categories = {column: Categories() for column in STRING_COLUMNS}
+        self._rows_by_id = {}
+
+    # Stable id of the marker at `row`
+    def marker_id(self, row):
+        self._check_row(row)
+        return int(self._ids[row])
+
+    # Make sure ids below `next_id` are never handed out again
+    def reserve_ids(self, next_id):
+        self._next_id = max(self._next_id, int(next_id))
+
+    # Current row of a marker id, or None if there is no such marker
+    def row_of(self, marker_id):
+        return self._rows_by_id.get(marker_id)
+
+    # New store with the markers at `rows`, keeping their ids. Its string tables only hold
+    # the values those markers use.
+    def take(self, rows):
+        codes, categories = {}, {}
+        for column in STRING_COLUMNS:
+            used, codes[column] = np.unique(self.codes(column)[rows], return_inverse=True)
+            values = self.categories(column)
+            categories[column] = [values[code] for code in used.tolist()]
+        subset = MarkerStore(capacity=len(rows))
+        subset.extend_coded(self.latitudes[rows], self.longitudes[rows], codes, categories, ids=self.ids[rows])
+        return subset
+
+    # Independent copy, e.g. for handing the current markers to a background job
+    def copy(self):
+        clone = MarkerStore(capacity=self._size)
+        clone.extend_store(self)
+        clone.reserve_ids(self._next_id)
+        return clone
+
+    # Return one marker as a dict keyed by column name
+    def row(self, row):
+        self._check_row(row)
+        marker = {'Latitude': float(self._lat[row]), 'Longitude': float(self._lon[row])}
+        for column in STRING_COLUMNS:
+            marker[column] = self._categories[column].values[self._codes[column][row]]
+        return marker
+
+    # Iterate over (latitude, longitude, label, color, icon) tuples
+    def iter_rows(self):
+        return zip(self.latitudes.tolist(), self.longitudes.tolist(),
+                   self.values('Label'), self.values('Color'), self.values('Icon'))
+
+    # Text shown for a marker in the list widget
+    def describe(self, row):
+        marker = self.row(row)
+        return f"{marker['Label']} ({marker['Latitude']}, {marker['Longitude']}) - {marker['Color']} - {marker['Icon']}"
+
+    # List widget text for a range of rows, built in one pass for batch inserts
+    def describe_rows(self, start=0, stop=None):
+        stop = self._size if stop is None else stop
+        labels, colors, icons = (self._categories[column].decode(self._codes[column][start:stop])
+                                 for column in STRING_COLUMNS)
+        return [f"{label} ({latitude}, {longitude}) - {color} - {icon}"
+                for latitude, longitude, label, color, icon in zip(
+                    self._lat[start:stop].tolist(), self._lon[start:stop].tolist(), labels, colors, icons)]
+
+    # Color and Icon come back as pandas categoricals sharing the store's dictionaries
+    def to_dataframe(self):
+        return pd.DataFrame({
+            'Latitude': self.latitudes.copy(),
+            'Longitude': self.longitudes.copy(),
+            'Label': self.values('Label'),
+            'Color': pd.Categorical.from_codes(self.codes('Color'), self.categories('Color')),
+            'Icon': pd.Categorical.from_codes(self.codes('Icon'), self.categories('Icon')),
+        }, columns=COLUMNS)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        store = cls(capacity=len(df))
+        icons = df['Icon'] if 'Icon' in df.columns else [DEFAULT_ICON] * len(df)
+        store.extend(df['Latitude'], df['Longitude'], df['Label'], df['Color'], icons)
+        return store
+
+    def _set_strings(self, row, label, color, icon):
+        self._codes['Label'][row] = self._categories['Label'].code(label)
+        self._codes['Color'][row] = self._categories['Color'].code(color)
+        self._codes['Icon'][row] = self._categories['Icon'].code(icon)
+
+    def _check_row(self, row):
+        if not 0 <= row < self._size:
+            raise IndexError(f"Marker row {row} out of range")
+
+
+def _grown(array, size, capacity):
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+
+# Marker strings are stored as text (non-string cells such as numeric labels are converted)
+def _as_text(value):
+    if isinstance(value, str):
+        return value
+    return str(value)
@@ -0,0 +1,109 @@
+import html
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from map_builder import build_map
+from workers import DetachedJob
+
+INDEX_FILE = 'index.html'
+# Partition value of markers whose split column is empty
+BLANK_VALUE = '(blank)'
+
+
+# Split a store into one store per distinct value of `values` (one value per marker, e.g.
+# store.values('Color') or a column of the source file). The rows are grouped once with a
+# stable sort of the value codes, so each partition keeps the markers in store order.
+# Returns [(value, store)] sorted by value.
+def split_store(store, values):
+    codes, distinct = pd.factorize(pd.Series(values, dtype=object).fillna(BLANK_VALUE).astype(str), sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(distinct)))
+    return [(value, store.take(rows)) for value, rows in zip(distinct.tolist(), np.split(order, bounds[:-1]))]
+
+
+# Render one map per partition in worker processes and write an index page linking them into
+# `output_dir`. Returns the path of the index page.
+#
+# Each partition is an independent map, so they are built in parallel with the same
+# build_map the GUI uses, one partition per task; a process pool sidesteps the GIL that keeps
+# folium's rendering on one core in a thread. Cancelling the job drops the partitions that
+# have not started yet.
+def render_partitions(job, store, values, output_dir, column, render_mode='markers', workers=None):
+    partitions = split_store(store, values)
+    os.makedirs(output_dir, exist_ok=True)
+    names = _file_names([value for value, _ in partitions])
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_partition, markers, os.path.join(output_dir, name), render_mode):
+                   (value, name, len(markers)) for (value, markers), name in zip(partitions, names)}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                job.check_cancelled()
+                results.append(futures[future] + (future.result(),))
+                job.report(done, len(futures))
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    write_index(index_path, column, sorted(results))
+    return index_path
+
+
+# Build the map of one partition; runs in a worker process. Returns the render seconds.
+def render_partition(markers, output_path, render_mode):
+    start = time.perf_counter()
+    build_map(DetachedJob(), [markers], len(markers), [markers.latitudes[0], markers.longitudes[0]], output_path,
+              render_mode)
+    return time.perf_counter() - start
+
+
+# Index page with a link to every partition map; `partitions` holds (value, file name,
+# markers, render seconds) tuples
+def write_index(file_path, column, partitions):
+    rows = '\n'.join(
+        f'<tr><td><a href="{quote(name)}">{html.escape(value)}</a></td><td>{markers}</td>'
+        f'<td>{seconds:.2f} s</td></tr>'
+        for value, name, markers, seconds in partitions)
+    title = html.escape(f"Maps by {column}")
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+td, th {{ padding: 0.2em 1em; text-align: left; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<table>
+<tr><th>{html.escape(column)}</th><th>Markers</th><th>Render time</th></tr>
+{rows}
+</table>
+</body>
+</html>
+""")
+
+
+# File names for partition values: unsafe characters become '_' and repeats (or a clash with
+# the index page) get a number
+def _file_names(values):
+    names, used = [], {os.path.splitext(INDEX_FILE)[0]}
+    for value in values:
+        base = re.sub(r'[^\w-]+', '_', value).strip('_') or 'partition'
+        name, number = base, 2
+        while name.lower() in used:
+            name, number = f'{base}_{number}', number + 1
+        used.add(name.lower())
+        names.append(name + '.html')
+    return names
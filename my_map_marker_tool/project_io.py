@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+
+from marker_store import STRING_COLUMNS, MarkerStore
+from validation import read_marker_csv, validate_markers
+
+# Binary project file layout:
+#
+#   MAGIC | header length (uint64, little endian) | JSON header | padding | column data
+#
+# The header records dtype, byte offset and length of every array. Latitude/longitude are
+# stored as raw float64 arrays, marker ids as int64; Label/Color/Icon as the store's int32
+# categorical codes plus their dictionary as a string table of NUL-separated UTF-8 values.
+# Arrays start on 64-byte boundaries so they can be opened with np.memmap without parsing any
+# text.
+MAGIC = b'MMPROJ1\n'
+BINARY_EXTENSION = '.mmproj'
+_ALIGNMENT = 64
+
+
+def is_binary_project(file_path):
+    return os.path.splitext(file_path)[1].lower() == BINARY_EXTENSION
+
+
+# Save the markers as a binary project file
+def save_binary_project(store, file_path):
+    arrays = {
+        'Latitude': np.ascontiguousarray(store.latitudes, dtype='<f8'),
+        'Longitude': np.ascontiguousarray(store.longitudes, dtype='<f8'),
+        'Id': np.ascontiguousarray(store.ids, dtype='<i8'),
+    }
+    for column in STRING_COLUMNS:
+        arrays[column] = np.ascontiguousarray(store.codes(column), dtype='<i4')
+        arrays[column + '.strings'] = np.frombuffer('\0'.join(store.categories(column)).encode('utf-8'),
+                                                    dtype=np.uint8)
+
+    # Lay the arrays out after the header, each on an aligned offset
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+        offset += array.nbytes
+    header = json.dumps({'count': len(store), 'next_id': store.next_id, 'columns': layout}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    # Write to a temporary file first so a failed save never clobbers the old project
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(header).to_bytes(8, 'little'))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name]['offset'])
+            file.write(array.tobytes())
+    os.replace(temp_path, file_path)
+
+
+# Load a binary project file by memory-mapping its column arrays
+def load_binary_project(file_path):
+    with open(file_path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{os.path.basename(file_path)} is not a map marker project file")
+        header_length = int.from_bytes(file.read(8), 'little')
+        header = json.loads(file.read(header_length).decode('utf-8'))
+    data_start = _align(len(MAGIC) + 8 + header_length)
+
+    def column(name):
+        info = header['columns'][name]
+        if info['length'] == 0:
+            return np.empty(0, dtype=info['dtype'])
+        return np.memmap(file_path, dtype=info['dtype'], mode='r',
+                         offset=data_start + info['offset'], shape=(info['length'],))
+
+    # The codes are used as they are; only the small string tables are decoded
+    codes = {name: column(name) for name in STRING_COLUMNS}
+    categories = {name: column(name + '.strings').tobytes().decode('utf-8').split('\0') for name in STRING_COLUMNS}
+
+    store = MarkerStore(capacity=header['count'])
+    store.extend_coded(column('Latitude'), column('Longitude'), codes, categories, ids=column('Id'))
+    store.reserve_ids(header['next_id'])
+    return store
+
+
+# CSV stays available as a plain-text export/import format
+def save_csv_project(store, file_path):
+    store.to_dataframe().to_csv(file_path, index=False)
+
+
+# Returns the store of valid rows and the validation report of the file
+def load_csv_project(file_path):
+    report = validate_markers(read_marker_csv(file_path))
+    return MarkerStore.from_dataframe(report.valid_frame), report
+
+
+# Save or load a project, picking the format from the file extension
+def save_project_file(store, file_path):
+    if is_binary_project(file_path):
+        save_binary_project(store, file_path)
+    else:
+        save_csv_project(store, file_path)
+
+
+# Returns the store and a validation report (None for binary projects, whose dtypes are fixed)
+def load_project_file(file_path):
+    if is_binary_project(file_path):
+        return load_binary_project(file_path), None
+    return load_csv_project(file_path)
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
@@ -0,0 +1,185 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from marker_store import MarkerStore
+from importers import prepare_marker_frame
+from partitions import render_partitions
+from project_io import load_csv_project
+from renderers import RENDER_MODES
+from render_cache import RenderCache, fingerprint
+from map_builder import MAP_ZOOM_START, build_map
+from workers import DetachedJob
+
+# Headless batch renderer: turns every CSV/XLSX marker file it is given into an HTML map with
+# the same build_map the GUI uses, one file per worker process.
+#
+#   python my_map_marker_tool/render_batch.py regions/ "extra/*.xlsx" -o maps --mode geojson
+#
+# Inputs may be files, directories (every .csv/.xlsx inside) or glob patterns. Files whose
+# markers and settings did not change since their map was written are skipped (see
+# RenderCache); pass --force to render them anyway.
+#
+# With --split-by COLUMN every file is instead split into one map per value of one of its
+# columns (any column, e.g. Color or a country/region column), rendered in parallel into
+# <output dir>/<file name>/ with an index.html linking them.
+INPUT_EXTENSIONS = ('.csv', '.xlsx')
+# Reported for inputs whose output would overwrite that of another input
+DUPLICATE_NAME = "same file name as another input; render them into separate output directories"
+
+
+# Expand the command line inputs into a sorted list of marker files
+def find_inputs(patterns):
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            # Expand patterns ourselves too, since Windows shells pass them through unexpanded
+            matches = glob.glob(pattern) or [pattern]
+        paths.update(path for path in matches if os.path.splitext(path)[1].lower() in INPUT_EXTENSIONS)
+    return sorted(paths)
+
+
+# Read and validate a marker file the way the GUI imports it
+def load_markers(file_path):
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        return load_csv_project(file_path)
+    report = prepare_marker_frame(pd.read_excel(file_path))
+    return MarkerStore.from_dataframe(report.valid_frame), report
+
+
+# Read and validate a marker file along with the values of `column` (matched ignoring case)
+# for each valid marker. Returns (store, report, values).
+def load_split_markers(file_path, column):
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        raw = pd.read_csv(file_path, keep_default_na=False, na_values=[''])
+    else:
+        raw = pd.read_excel(file_path)
+    report = prepare_marker_frame(raw)
+    matches = [name for name in raw.columns if str(name).strip().lower() == column.strip().lower()]
+    if not matches:
+        raise ValueError(f"no column named {column!r}")
+    values = raw[matches[0]].to_numpy(dtype=object)[report.valid_rows()]
+    return MarkerStore.from_dataframe(report.valid_frame), report, values
+
+
+# Render one file in a worker process. Returns (input path, output path, markers, skipped
+# rows, load seconds, render seconds, status) where status is 'rendered', 'unchanged' or an
+# error message, so one bad file does not stop the batch.
+def render_file(input_path, output_path, render_mode, force=False):
+    start = time.perf_counter()
+    markers = skipped = 0
+    loaded = start
+    try:
+        store, report = load_markers(input_path)
+        markers, skipped = len(store), report.rejected
+        loaded = time.perf_counter()
+        if markers == 0:
+            return input_path, output_path, markers, skipped, loaded - start, 0.0, "no valid markers"
+
+        cache = RenderCache()
+        map_fingerprint = fingerprint(store, {'render_mode': render_mode, 'zoom_start': MAP_ZOOM_START})
+        if not force and cache.is_current(output_path, map_fingerprint):
+            return input_path, output_path, markers, skipped, loaded - start, 0.0, 'unchanged'
+        build_map(DetachedJob(), [store], markers, [store.latitudes[0], store.longitudes[0]], output_path,
+                  render_mode)
+        cache.remember(output_path, map_fingerprint)
+        return input_path, output_path, markers, skipped, loaded - start, time.perf_counter() - loaded, 'rendered'
+    except Exception as e:
+        return input_path, output_path, markers, skipped, loaded - start, 0.0, f"{type(e).__name__}: {e}"
+
+
+# Output name of every input: the file name without its extension, or with it (foo.csv,
+# foo.xlsx) where two inputs share the name without extension. Inputs with the same full file
+# name (e.g. from two folders) get None, and are reported as failed instead of overwriting
+# each other's maps.
+def output_names(inputs):
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in inputs]
+    stem_counts = Counter(stem.lower() for stem in stems)
+    names = [os.path.basename(path) if stem_counts[stem.lower()] > 1 else stem for path, stem in zip(inputs, stems)]
+    name_counts = Counter(name.lower() for name in names)
+    return [name if name_counts[name.lower()] == 1 else None for name in names]
+
+
+# Split every file by a column and render its partitions in parallel, one file at a time
+def split_files(inputs, output_dir, column, render_mode, workers):
+    failed = 0
+    for input_path, name in zip(inputs, output_names(inputs)):
+        if name is None:
+            failed += 1
+            print(f"{'failed':>9}  {input_path}: {DUPLICATE_NAME}")
+            continue
+        start = time.perf_counter()
+        file_dir = os.path.join(output_dir, name)
+        try:
+            store, report, values = load_split_markers(input_path, column)
+            if len(store) == 0:
+                raise ValueError("no valid markers")
+            loaded = time.perf_counter()
+            index_path = render_partitions(DetachedJob(), store, values, file_dir, column, render_mode, workers)
+        except Exception as e:
+            failed += 1
+            print(f"{'failed':>9}  {input_path}: {type(e).__name__}: {e}")
+            continue
+        note = f", {report.rejected} rows skipped" if report.rejected else ""
+        print(f"{'split':>9}  {input_path} -> {index_path}: {len(store)} markers{note}, "
+              f"load {loaded - start:.2f} s, render {time.perf_counter() - loaded:.2f} s")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render CSV/XLSX marker files to HTML maps in parallel")
+    parser.add_argument('inputs', nargs='+', help="marker files, directories or glob patterns")
+    parser.add_argument('-o', '--output-dir', default='maps', help="where the maps are written (default: maps)")
+    parser.add_argument('--mode', choices=RENDER_MODES, default=RENDER_MODES[0], help="how markers are drawn")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--force', action='store_true', help="render files whose map is up to date too")
+    parser.add_argument('--split-by', metavar='COLUMN',
+                        help="render one map per value of this column of every file, plus an index page")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("no .csv or .xlsx files found")
+    if args.split_by:
+        start = time.perf_counter()
+        failed = split_files(inputs, args.output_dir, args.split_by, args.mode, args.workers)
+        print(f"Done in {time.perf_counter() - start:.2f} s, {failed} failed")
+        return 1 if failed else 0
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    print(f"Rendering {len(inputs)} files with {args.workers} workers")
+    start = time.perf_counter()
+    failed = 0
+    jobs = []
+    for input_path, name in zip(inputs, output_names(inputs)):
+        if name is None:
+            failed += 1
+            print(f"{'failed':>9}  {input_path}: {DUPLICATE_NAME}")
+        else:
+            jobs.append((input_path, os.path.join(args.output_dir, name + '.html')))
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(render_file, input_path, output_path, args.mode, args.force)
+                   for input_path, output_path in jobs]
+        for future in as_completed(futures):
+            input_path, output_path, markers, skipped, load_seconds, render_seconds, status = future.result()
+            if status in ('rendered', 'unchanged'):
+                note = f", {skipped} rows skipped" if skipped else ""
+                print(f"{status:>9}  {input_path} -> {output_path}: {markers} markers{note}, "
+                      f"load {load_seconds:.2f} s, render {render_seconds:.2f} s")
+            else:
+                failed += 1
+                print(f"{'failed':>9}  {input_path}: {status}")
+    print(f"Done in {time.perf_counter() - start:.2f} s, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
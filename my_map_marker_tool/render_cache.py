@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from marker_store import STRING_COLUMNS
+from renderers import StyleTable, geojson_features, json_labels
+
+# Markers per cached GeoJSON chunk. Chunks are cut by marker id, so adding, editing or
+# deleting a marker only invalidates the chunk its id falls in.
+CHUNK_SIZE = 4096
+
+
+# Fingerprint of a set of markers plus the settings a map was rendered with
+def fingerprint(store, settings):
+    digest = hashlib.blake2b(json.dumps(settings, sort_keys=True).encode('utf-8'), digest_size=16)
+    for array in (store.latitudes, store.longitudes, store.ids):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    for column in STRING_COLUMNS:
+        digest.update(np.ascontiguousarray(store.codes(column)).tobytes())
+        digest.update('\0'.join(store.categories(column)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Remembers what the last map was built from, so create_map can skip work that would
+# produce the same output.
+#
+# A whole map is reused when its fingerprint (stored next to the HTML file) matches. Below
+# that, the GeoJSON features of every chunk of markers are kept under a hash of the chunk's
+# content, and the next map reuses all chunks whose hash did not change. Style indices in
+# cached features refer to `style_table`, which only ever grows, so they stay valid.
+class RenderCache:
+    def __init__(self):
+        self.style_table = StyleTable()
+        self._chunks = {}
+        self._used = {}
+
+    # Whether `output_map_file` was saved from exactly this fingerprint
+    def is_current(self, output_map_file, map_fingerprint):
+        try:
+            with open(output_map_file + '.fingerprint', encoding='utf-8') as file:
+                return file.read() == map_fingerprint and os.path.exists(output_map_file)
+        except OSError:
+            return False
+
+    # Record a finished map. If it was built from cached chunks, the chunks it did not use
+    # are dropped from the cache. Without a fingerprint the next map is always rebuilt.
+    def remember(self, output_map_file, map_fingerprint=None):
+        with open(output_map_file + '.fingerprint', 'w', encoding='utf-8') as file:
+            file.write(map_fingerprint or '')
+        if self._used:
+            self._chunks, self._used = self._used, {}
+
+    # (features, count) for the markers of `store`, chunk by chunk in id order
+    def features(self, store, style_table):
+        if style_table is not self.style_table:
+            raise ValueError("Cached features need the cache's style table")
+        order = np.argsort(store.ids, kind='stable')
+        chunk_ids = store.ids[order] // CHUNK_SIZE
+        bounds = np.flatnonzero(np.r_[True, chunk_ids[1:] != chunk_ids[:-1], True])
+        latitudes = store.latitudes[order]
+        longitudes = store.longitudes[order]
+        labels = json_labels(store)[order]
+        styles = style_table.codes(store)[order]
+
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            digest = hashlib.blake2b(digest_size=16)
+            for array in (latitudes[start:stop], longitudes[start:stop], styles[start:stop]):
+                digest.update(array.tobytes())
+            digest.update('\0'.join(labels[start:stop]).encode('utf-8'))
+            key = digest.digest()
+            features = self._chunks.get(key)
+            if features is None:
+                features = geojson_features(latitudes[start:stop], longitudes[start:stop], labels[start:stop],
+                                            styles[start:stop])
+            self._used[key] = features
+            yield features, stop - start
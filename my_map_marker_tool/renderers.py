@@ -0,0 +1,807 @@
+import base64
+import gzip
+import json
+from json.encoder import encode_basestring_ascii
+
+import numpy as np
+import folium
+from branca.element import Element, MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+# How create_map draws the markers:
+#   'markers' - one folium.Marker per row, sharing one icon per (color, icon) pair
+#   'circles' - no icons, one circle per row in its color, all drawn on a single canvas
+#   'geojson' - one GeoJSON FeatureCollection drawn by a single Leaflet layer
+#   'cluster' - the same GeoJSON layer, grouped into Leaflet.markercluster clusters
+#   'indexed' - clusters precomputed per zoom level in Python, markers loaded per visible tile
+#   'external' - a small HTML page that loads the markers from a compressed data file after painting
+#   'vector' - Mapbox Vector Tiles written next to the page, loaded per visible tile
+#   'density' - no markers, only the marker count of every cell of a grid, shaded by count
+#   'lod' - markers thinned per zoom level on a grid, keeping red (priority) ones, so every zoom shows about as many
+RENDER_MODES = ('markers', 'circles', 'geojson', 'cluster', 'indexed', 'external', 'vector', 'density', 'lod')
+# 6 decimals are ~0.1 m, well below what a marker on a map can show
+COORDINATE_DECIMALS = 6
+
+# Fill colors of the Leaflet.awesome-markers sprites, for layers that draw markers as dots
+MARKER_COLORS = {
+    'red': '#d63e2a', 'darkred': '#a23336', 'lightred': '#ff8e7f', 'orange': '#f69730', 'beige': '#ffcb92',
+    'green': '#72b026', 'darkgreen': '#728224', 'lightgreen': '#bbf970', 'blue': '#38aadd', 'darkblue': '#0067a3',
+    'cadetblue': '#436978', 'lightblue': '#8adaff', 'purple': '#d252b9', 'darkpurple': '#5b396b',
+    'pink': '#ff91ea', 'white': '#fbfbfb', 'gray': '#575757', 'lightgray': '#a3a3a3', 'black': '#303030',
+}
+# Fill colors of density cells from the fewest to the most markers (ColorBrewer YlOrRd)
+DENSITY_COLORS = ['#ffffb2', '#fed976', '#feb24c', '#fd8d3c', '#f03b20', '#bd0026']
+
+# JavaScript function turning a [color, icon] style into a Leaflet icon. Named colors use the
+# Leaflet.awesome-markers sprites folium.Icon draws; '#RRGGBB' colors, which folium.Icon
+# cannot show, get an SVG pin of that color with the same glyphicon on top.
+ICON_FACTORY = """function(style) {
+    if (style[0].charAt(0) !== '#') {
+        return L.AwesomeMarkers.icon({markerColor: style[0], icon: style[1], prefix: 'glyphicon'});
+    }
+    return L.divIcon({
+        className: 'hex-color-marker',
+        html: '<svg width="28" height="40" viewBox="0 0 28 40"><path fill="' + style[0] + '" stroke="rgba(0,0,0,0.3)" '
+              + 'd="M14 1C6.8 1 1 6.8 1 14c0 9.6 13 25 13 25s13-15.4 13-25C27 6.8 21.2 1 14 1z"/></svg>'
+              + '<i class="glyphicon glyphicon-' + style[1] + '" style="position:absolute;left:0;top:8px;'
+              + 'width:28px;text-align:center;color:#fff"></i>',
+        iconSize: [28, 40],
+        iconAnchor: [14, 40],
+        popupAnchor: [0, -34]
+    });
+}"""
+
+
+# All markers of a map as one GeoJSON FeatureCollection, drawn by a single L.geoJSON layer.
+#
+# Features only carry the popup label and the index of their (color, icon) pair in a shared
+# style table; the icons are built once per pair in the browser and looked up by the layer's
+# pointToLayer function, so the HTML grows by one small feature per marker instead of a
+# Marker + Icon script block. Markers are added column-wise, one MarkerStore batch at a time.
+#
+# With `cluster=True` the markers are handed to an L.markerClusterGroup in one bulk
+# addLayers call with chunked loading, so only the visible clusters become DOM elements and
+# maps with a few hundred thousand markers stay responsive while panning.
+class GeoJsonMarkers(JSCSSMixin):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_icons = {{ this.styles|tojson }}.map({{ this.icon_factory }});
+            var {{ this.get_name() }} = L.geoJSON({{ this.get_name() }}_data, {
+                pointToLayer: function(feature, latlng) {
+                    return L.marker(latlng, {icon: {{ this.get_name() }}_icons[feature.properties.style]});
+                },
+                onEachFeature: function(feature, layer) {
+                    layer.bindPopup(function() {
+                        var popup = document.createElement('div');
+                        popup.textContent = feature.properties.label;
+                        return popup;
+                    });
+                }
+            });
+            {%- if this.cluster %}
+            var {{ this.get_name() }}_cluster = L.markerClusterGroup({chunkedLoading: true});
+            {{ this.get_name() }}_cluster.addLayers({{ this.get_name() }}.getLayers());
+            {{ this.get_name() }}_cluster.addTo({{ this._parent.get_name() }});
+            {%- else %}
+            {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+            {%- endif %}
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+
+    # Pass a `style_table` to share style indices with features built for earlier maps
+    def __init__(self, cluster=False, style_table=None):
+        super().__init__()
+        self._name = 'GeoJsonMarkers'
+        self.cluster = cluster
+        if cluster:
+            self.default_js = list(MarkerCluster.default_js)
+            self.default_css = list(MarkerCluster.default_css)
+        self.style_table = StyleTable() if style_table is None else style_table
+        # Comma-separated feature lists, one per added batch
+        self._chunks = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def styles(self):
+        return self.style_table.styles
+
+    # Add every marker of a MarkerStore. With a RenderCache the features of chunks that did
+    # not change since the last map are reused instead of being built again.
+    def add_store(self, store, cache=None):
+        if len(store) == 0:
+            return
+        if cache is not None:
+            for features, count in cache.features(store, self.style_table):
+                self.add_features(features, count)
+            return
+        self.add_features(geojson_features(store.latitudes, store.longitudes, json_labels(store),
+                                           self.style_table.codes(store)), len(store))
+
+    # Add features built by geojson_features() with this layer's style table
+    def add_features(self, features, count):
+        self._chunks.append(features)
+        self._count += count
+
+    def feature_collection(self):
+        return '{"type":"FeatureCollection","features":[' + ','.join(self._chunks) + ']}'
+
+    def render(self, **kwargs):
+        # The data goes in as a raw script ahead of the layer code, so it is not compiled
+        # as a Jinja template like MacroElement script output is
+        self.get_root().script.add_child(
+            RawScript(f'var {self.get_name()}_data = {self.feature_collection()};'),
+            name=self.get_name() + '_data')
+        super().render(**kwargs)
+
+
+# One Leaflet icon per distinct (color, icon) pair of a map, for SharedIconMarker to refer to.
+# Add it to the map before the markers so the icons exist when the markers are created.
+class IconTable(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = {{ this.style_table.styles|tojson }}.map({{ this.icon_factory }});
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+
+    def __init__(self, style_table=None):
+        super().__init__()
+        self._name = 'IconTable'
+        self.style_table = StyleTable() if style_table is None else style_table
+
+
+# folium.Marker whose icon is an entry of an IconTable instead of its own folium.Icon, so a
+# marker costs one L.marker call and no icon object or setIcon call of its own. The label is
+# bound as an HTML-escaped popup string rather than a separate folium.Popup element.
+class SharedIconMarker(folium.Marker):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.marker({{ this.location|tojson }},
+                {icon: {{ this.icon_table.get_name() }}[{{ this.style }}]}).addTo({{ this._parent.get_name() }})
+            {%- if this.label is not none %}.bindPopup({{ this.label|e|string|tojson }}){% endif %};
+        {% endmacro %}
+    """)
+
+    def __init__(self, location, icon_table, style, label=None):
+        super().__init__(location=location)
+        self.icon_table = icon_table
+        self.style = style
+        self.label = label
+
+
+# Markers drawn as plain circles in their color, for dense maps where icons do not matter
+# (e.g. compliance dots colored green/red).
+#
+# Meant for maps created with prefer_canvas=True: every L.circleMarker is then drawn on the
+# map's single canvas instead of becoming an SVG element, so panning and zooming repaint one
+# bitmap however many points there are. The data is embedded column-wise, with each distinct
+# color and label written once, and one click handler on the layer opens the popups.
+class CircleMarkers(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map, data) {
+                var layer = L.featureGroup().on('click', function(e) {
+                    var popup = document.createElement('div');
+                    popup.textContent = data.labels[data.label[e.layer.options.row]];
+                    L.popup().setLatLng(e.latlng).setContent(popup).openOn(map);
+                });
+                for (var i = 0; i < data.latitude.length; i++) {
+                    layer.addLayer(L.circleMarker([data.latitude[i], data.longitude[i]], {
+                        row: i, radius: {{ this.radius }}, weight: 1, color: '#ffffff',
+                        fillColor: data.colors[data.color[i]], fillOpacity: 0.9
+                    }));
+                }
+                return layer.addTo(map);
+            })({{ this._parent.get_name() }}, {{ this.get_name() }}_data);
+        {% endmacro %}
+    """)
+
+    def __init__(self, store, radius=5):
+        super().__init__()
+        self._name = 'CircleMarkers'
+        self.radius = radius
+        self._data = self._build(store)
+
+    def render(self, **kwargs):
+        self.get_root().script.add_child(RawScript(f'var {self.get_name()}_data = {self._data};'),
+                                         name=self.get_name() + '_data')
+        super().render(**kwargs)
+
+    def _build(self, store):
+        colors = [MARKER_COLORS.get(color, color) for color in store.categories('Color')]
+        labels = [script_string(label) for label in store.categories('Label')]
+        latitudes = np.round(store.latitudes, COORDINATE_DECIMALS).tolist()
+        longitudes = np.round(store.longitudes, COORDINATE_DECIMALS).tolist()
+        return (f'{{"latitude":{json.dumps(latitudes)},"longitude":{json.dumps(longitudes)},'
+                f'"color":{json.dumps(store.codes("Color").tolist())},"colors":{json.dumps(colors)},'
+                f'"label":{json.dumps(store.codes("Label").tolist())},"labels":[{",".join(labels)}]}}')
+
+
+# Markers shown by level of detail, from the per-marker zoom levels of lod.detail_zooms().
+#
+# The markers are embedded column-wise and sorted by the zoom level they appear at, with the
+# end of every zoom level's markers in `ends`, so the markers of the current zoom are a prefix
+# of the arrays. On every move the layer draws the markers of that prefix inside the
+# (slightly padded) viewport, keeping the ones already drawn, so the page holds about a
+# screenful of markers at any zoom.
+class LevelOfDetailMarkers(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map, data, styles, iconFactory) {
+                var layer = L.layerGroup().addTo(map);
+                var icons = styles.map(iconFactory);
+                // row -> drawn L.marker
+                var drawn = {};
+
+                function addMarker(row) {
+                    var marker = L.marker([data.latitude[row], data.longitude[row]], {icon: icons[data.style[row]]});
+                    marker.bindPopup(function() {
+                        var popup = document.createElement('div');
+                        popup.textContent = data.labels[data.label[row]];
+                        return popup;
+                    });
+                    layer.addLayer(marker);
+                    return marker;
+                }
+
+                function update() {
+                    var level = Math.min(Math.max(map.getZoom() - data.min_zoom, 0), data.ends.length - 1);
+                    var bounds = map.getBounds().pad(0.25);
+                    var south = bounds.getSouth(), north = bounds.getNorth();
+                    var west = bounds.getWest(), east = bounds.getEast();
+                    var wanted = {};
+                    for (var row = 0; row < data.ends[level]; row++) {
+                        var latitude = data.latitude[row], longitude = data.longitude[row];
+                        if (latitude >= south && latitude <= north && longitude >= west && longitude <= east) {
+                            wanted[row] = drawn[row] || addMarker(row);
+                        }
+                    }
+                    for (var key in drawn) {
+                        if (wanted[key] === undefined) {
+                            layer.removeLayer(drawn[key]);
+                        }
+                    }
+                    drawn = wanted;
+                }
+
+                map.on('moveend', update);
+                update();
+                return layer;
+            })({{ this._parent.get_name() }}, {{ this.get_name() }}_data, {{ this.style_table.styles|tojson }},
+               {{ this.icon_factory }});
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+
+    # `zooms` holds the zoom level from which each marker of `store` is shown
+    def __init__(self, store, zooms, min_zoom=0):
+        super().__init__()
+        self._name = 'LevelOfDetailMarkers'
+        self.style_table = StyleTable()
+        self._data = self._build(store, np.asarray(zooms), min_zoom)
+
+    def render(self, **kwargs):
+        self.get_root().script.add_child(RawScript(f'var {self.get_name()}_data = {self._data};'),
+                                         name=self.get_name() + '_data')
+        super().render(**kwargs)
+
+    def _build(self, store, zooms, min_zoom):
+        order = np.argsort(zooms, kind='stable')
+        ends = np.searchsorted(zooms[order], np.arange(min_zoom, zooms.max(initial=min_zoom) + 1), side='right')
+        labels = [script_string(label) for label in store.categories('Label')]
+        latitudes = np.round(store.latitudes[order], COORDINATE_DECIMALS).tolist()
+        longitudes = np.round(store.longitudes[order], COORDINATE_DECIMALS).tolist()
+        return (f'{{"min_zoom":{int(min_zoom)},"ends":{json.dumps(ends.tolist())},'
+                f'"latitude":{json.dumps(latitudes)},"longitude":{json.dumps(longitudes)},'
+                f'"style":{json.dumps(self.style_table.codes(store)[order].tolist())},'
+                f'"label":{json.dumps(store.codes("Label")[order].tolist())},"labels":[{",".join(labels)}]}}')
+
+
+# Marker density as a choropleth of grid cells, from a DensityGrid (see density.py).
+#
+# The page only gets the non-empty cells (column, row, count) and the cell edges, so a
+# million markers become a few thousand canvas rectangles. Cells are shaded by the logarithm
+# of their count, as marker counts of crowded and empty areas differ by orders of magnitude;
+# clicking a cell shows its count and a legend gives the count range of every shade.
+class DensityCells(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map, data, colors) {
+                var top = Math.log(Math.max.apply(null, data.count.concat([1])) + 1);
+                // Smallest count drawn in shade k
+                function lowest(k) {
+                    return Math.max(Math.ceil(Math.exp(top * k / colors.length) - 1), 1);
+                }
+                function shade(count) {
+                    return Math.min(Math.floor(Math.log(count + 1) / top * colors.length), colors.length - 1);
+                }
+                var layer = L.featureGroup().on('click', function(e) {
+                    var count = e.layer.options.count;
+                    L.popup().setLatLng(e.latlng).setContent(count + (count === 1 ? ' marker' : ' markers'))
+                        .openOn(map);
+                });
+                for (var i = 0; i < data.count.length; i++) {
+                    var column = data.column[i], row = data.row[i];
+                    layer.addLayer(L.rectangle([[data.latitude[row + 1], data.longitude[column]],
+                                                [data.latitude[row], data.longitude[column + 1]]], {
+                        count: data.count[i], stroke: false, fillColor: colors[shade(data.count[i])], fillOpacity: 0.7
+                    }));
+                }
+                var legend = L.control({position: 'bottomright'});
+                legend.onAdd = function() {
+                    var div = L.DomUtil.create('div', 'leaflet-bar');
+                    div.style.cssText = 'background:#fff;padding:4px 8px;font:12px sans-serif';
+                    for (var k = 0; k < colors.length; k++) {
+                        var low = lowest(k);
+                        var high = k === colors.length - 1 ? Math.round(Math.exp(top) - 1) : lowest(k + 1) - 1;
+                        if (high < low) continue;
+                        L.DomUtil.create('div', '', div).innerHTML =
+                            '<span style="display:inline-block;width:12px;height:12px;margin-right:4px;background:'
+                            + colors[k] + '"></span>' + low + (high > low ? '&ndash;' + high : '');
+                    }
+                    return div;
+                };
+                legend.addTo(map);
+                return layer.addTo(map);
+            })({{ this._parent.get_name() }}, {{ this.get_name() }}_data, {{ this.colors|tojson }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, grid, colors=DENSITY_COLORS):
+        super().__init__()
+        self._name = 'DensityCells'
+        self.colors = colors
+        self._data = self._build(grid)
+
+    def render(self, **kwargs):
+        self.get_root().script.add_child(RawScript(f'var {self.get_name()}_data = {self._data};'),
+                                         name=self.get_name() + '_data')
+        super().render(**kwargs)
+
+    def _build(self, grid):
+        latitudes = np.round(grid.latitudes, COORDINATE_DECIMALS).tolist()
+        longitudes = np.round(grid.longitudes, COORDINATE_DECIMALS).tolist()
+        return (f'{{"latitude":{json.dumps(latitudes)},"longitude":{json.dumps(longitudes)},'
+                f'"column":{json.dumps(grid.columns.tolist())},"row":{json.dumps(grid.rows.tolist())},'
+                f'"count":{json.dumps(grid.counts.tolist())}}}')
+
+
+# Markers drawn from a precomputed ClusterIndex (see cluster_index.py).
+#
+# The page embeds the clusters of every zoom level below the index's detail zoom, and the
+# raw markers grouped into Web Mercator tiles of the detail zoom. Each tile is kept as a JSON
+# string and only parsed when it first comes into view, and on every move the layer redraws
+# just the clusters or markers inside the viewport, so the browser never holds more than the
+# visible part of a million-marker project as Leaflet markers.
+class ZoomClusterLayer(JSCSSMixin):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_icons = {{ this.styles|tojson }}.map({{ this.icon_factory }});
+            var {{ this.get_name() }} = (function(map, data, icons) {
+                var layer = L.layerGroup().addTo(map);
+                var parsedTiles = {};
+
+                function clusterIcon(count) {
+                    var size = count < 100 ? 'small' : count < 1000 ? 'medium' : 'large';
+                    return L.divIcon({html: '<div><span>' + count + '</span></div>',
+                                      className: 'marker-cluster marker-cluster-' + size,
+                                      iconSize: L.point(40, 40)});
+                }
+
+                // point = [latitude, longitude, label, style]
+                function addMarker(point) {
+                    var marker = L.marker([point[0], point[1]], {icon: icons[point[3]]});
+                    marker.bindPopup(function() {
+                        var popup = document.createElement('div');
+                        popup.textContent = point[2];
+                        return popup;
+                    });
+                    layer.addLayer(marker);
+                }
+
+                // cluster = [latitude, longitude, count] or, for single markers,
+                // [latitude, longitude, 1, label, style]
+                function addCluster(cluster, zoom) {
+                    if (cluster[2] === 1) {
+                        addMarker([cluster[0], cluster[1], cluster[3], cluster[4]]);
+                        return;
+                    }
+                    var marker = L.marker([cluster[0], cluster[1]], {icon: clusterIcon(cluster[2])});
+                    marker.on('click', function() {
+                        map.setView(marker.getLatLng(), Math.min(zoom + 2, data.detail_zoom));
+                    });
+                    layer.addLayer(marker);
+                }
+
+                function update() {
+                    layer.clearLayers();
+                    var zoom = map.getZoom();
+                    var bounds = map.getBounds().pad(0.25);
+                    if (zoom < data.detail_zoom) {
+                        data.levels[Math.max(zoom, data.min_zoom)].forEach(function(cluster) {
+                            if (bounds.contains([cluster[0], cluster[1]])) {
+                                addCluster(cluster, zoom);
+                            }
+                        });
+                        return;
+                    }
+                    var last = Math.pow(2, data.detail_zoom) - 1;
+                    var topLeft = map.project(bounds.getNorthWest(), data.detail_zoom).divideBy(256).floor();
+                    var bottomRight = map.project(bounds.getSouthEast(), data.detail_zoom).divideBy(256).floor();
+                    for (var x = Math.max(topLeft.x, 0); x <= Math.min(bottomRight.x, last); x++) {
+                        for (var y = Math.max(topLeft.y, 0); y <= Math.min(bottomRight.y, last); y++) {
+                            var key = x + '/' + y;
+                            if (data.tiles[key] === undefined) {
+                                continue;
+                            }
+                            if (parsedTiles[key] === undefined) {
+                                parsedTiles[key] = JSON.parse(data.tiles[key]);
+                            }
+                            parsedTiles[key].forEach(function(point) {
+                                if (bounds.contains([point[0], point[1]])) {
+                                    addMarker(point);
+                                }
+                            });
+                        }
+                    }
+                }
+
+                map.on('moveend', update);
+                update();
+                return layer;
+            })({{ this._parent.get_name() }}, {{ this.get_name() }}_data, {{ this.get_name() }}_icons);
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+    # Only the stylesheet of Leaflet.markercluster, for the cluster bubbles
+    default_css = list(MarkerCluster.default_css)
+
+    def __init__(self, store, index):
+        super().__init__()
+        self._name = 'ZoomClusterLayer'
+        self.style_table = StyleTable()
+        self._data = self._build(store, index)
+
+    @property
+    def styles(self):
+        return self.style_table.styles
+
+    def render(self, **kwargs):
+        self.get_root().script.add_child(RawScript(f'var {self.get_name()}_data = {self._data};'),
+                                         name=self.get_name() + '_data')
+        super().render(**kwargs)
+
+    def _build(self, store, index):
+        labels = json_labels(store)
+        styles = self.style_table.codes(store)
+
+        levels = []
+        for zoom in range(index.min_zoom, index.max_zoom + 1):
+            latitudes, longitudes, counts, rows = index.clusters(zoom)
+            clusters = [
+                f'[{latitude},{longitude},1,{labels[row]},{styles[row]}]' if count == 1
+                else f'[{latitude},{longitude},{count}]'
+                for latitude, longitude, count, row in zip(
+                    np.round(latitudes, COORDINATE_DECIMALS).tolist(),
+                    np.round(longitudes, COORDINATE_DECIMALS).tolist(),
+                    counts.tolist(), rows.tolist())]
+            levels.append(f'"{zoom}":[' + ','.join(clusters) + ']')
+
+        points = np.array([
+            f'[{latitude},{longitude},{label},{style}]'
+            for latitude, longitude, label, style in zip(
+                np.round(store.latitudes, COORDINATE_DECIMALS).tolist(),
+                np.round(store.longitudes, COORDINATE_DECIMALS).tolist(),
+                labels.tolist(), styles.tolist())], dtype=object)
+        tiles = [f'"{x}/{y}":' + script_string('[' + ','.join(points[rows]) + ']')
+                 for (x, y), rows in index.tiles().items()]
+
+        return (f'{{"min_zoom":{index.min_zoom},"detail_zoom":{index.detail_zoom},'
+                f'"levels":{{{",".join(levels)}}},"tiles":{{{",".join(tiles)}}}}}')
+
+
+# Markers kept out of the HTML page in a compressed sidecar file.
+#
+# The sidecar holds the markers as packed binary arrays (see pack_markers), gzip-compressed
+# and wrapped as a base64 string in a tiny script, because browsers refuse fetch() for pages
+# opened from file:// but do load <script src>. The page only contains the tiles and icons;
+# once the map has painted it loads the sidecar, inflates it with DecompressionStream and
+# adds the markers. The sidecar is a static file, so browsers can cache it.
+class ExternalDataMarkers(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map, icons) {
+                var layer = L.layerGroup().addTo(map);
+
+                function inflate(text) {
+                    var bytes = Uint8Array.from(atob(text), function(c) { return c.charCodeAt(0); });
+                    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+                    return new Response(stream).arrayBuffer();
+                }
+
+                function addMarkers(buffer) {
+                    var headerLength = new DataView(buffer).getUint32(0, true);
+                    var header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+                    var count = header.count;
+                    var offset = Math.ceil((4 + headerLength) / 4) * 4;
+                    var columns = {};
+                    header.columns.forEach(function(name) {
+                        columns[name] = new Int32Array(buffer, offset, count);
+                        offset += 4 * count;
+                    });
+                    for (var i = 0; i < count; i++) {
+                        var marker = L.marker([columns.latitude[i] / {{ this.scale }}, columns.longitude[i] / {{ this.scale }}],
+                                              {icon: icons[columns.style[i]]});
+                        marker.bindPopup((function(label) {
+                            return function() {
+                                var popup = document.createElement('div');
+                                popup.textContent = label;
+                                return popup;
+                            };
+                        })(header.labels[columns.label[i]]));
+                        layer.addLayer(marker);
+                    }
+                }
+
+                map.whenReady(function() {
+                    // Give the browser a frame to paint the map before loading the markers
+                    setTimeout(function() {
+                        var script = document.createElement('script');
+                        script.src = {{ this.data_url|tojson }};
+                        script.onload = function() {
+                            var payload = window[{{ this.payload_name|tojson }}];
+                            delete window[{{ this.payload_name|tojson }}];
+                            inflate(payload).then(addMarkers);
+                        };
+                        document.head.appendChild(script);
+                    }, 0);
+                });
+                return layer;
+            })({{ this._parent.get_name() }}, {{ this.style_table.styles|tojson }}.map({{ this.icon_factory }}));
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+    scale = 10 ** COORDINATE_DECIMALS
+
+    # `data_url` is where the page finds the sidecar, relative to the HTML file
+    def __init__(self, data_url):
+        super().__init__()
+        self._name = 'ExternalDataMarkers'
+        self.data_url = data_url
+        self.payload_name = self.get_name() + '_payload'
+        self.style_table = StyleTable()
+
+    # Write the markers of `store` to the sidecar file at `data_path`
+    def write_data(self, store, data_path):
+        payload = base64.b64encode(gzip.compress(pack_markers(store, self.style_table), compresslevel=6))
+        with open(data_path, 'w', encoding='ascii') as file:
+            file.write(f'window[{json.dumps(self.payload_name)}] = "{payload.decode("ascii")}";\n')
+
+
+# Markers drawn from Mapbox Vector Tiles (see vector_tiles.py) with Leaflet.VectorGrid.
+#
+# The page holds no marker data at all: the layer fetches the .pbf tile of every visible
+# tile position and draws its points as canvas circles in the marker's color, so a
+# national data set costs the browser no more than the tiles in view. Beyond
+# `max_native_zoom` the most detailed tiles are scaled up. Browsers do not fetch tiles for
+# pages opened from file://, so the map has to be served over HTTP (see map_server.py).
+class VectorTileMarkers(JSCSSMixin):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+                rendererFactory: L.canvas.tile,
+                interactive: true,
+                maxNativeZoom: {{ this.max_native_zoom }},
+                getFeatureId: function(feature) { return feature.id; },
+                vectorTileLayerStyles: {
+                    {{ this.layer_name|tojson }}: function(properties) {
+                        return {radius: 6, weight: 1, color: '#ffffff', fill: true,
+                                fillColor: properties.color, fillOpacity: 0.9};
+                    }
+                }
+            }).on('click', function(e) {
+                var popup = document.createElement('div');
+                popup.textContent = e.layer.properties.label;
+                L.popup().setLatLng(e.latlng).setContent(popup).openOn({{ this._parent.get_name() }});
+            }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    default_js = [('vectorgrid', 'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.min.js')]
+
+    # `url` is the {z}/{x}/{y} tile URL template, relative to the HTML file
+    def __init__(self, url, layer_name, max_native_zoom):
+        super().__init__()
+        self._name = 'VectorTileMarkers'
+        self.url = url
+        self.layer_name = layer_name
+        self.max_native_zoom = max_native_zoom
+
+
+# Markers fetched from a MarkerServer (see map_server.py) for the current viewport.
+#
+# The page holds no marker data: after every move it asks the server for the markers in the
+# (slightly padded) visible bounds at the current zoom, which the server thins to roughly
+# what fits on the screen, and replaces the drawn markers with the answer. Answers to views
+# that were left before they arrived are dropped. An EventSource applies the server's live
+# edits to the drawn markers one marker at a time, and reloads the page when the server
+# switched to a new snapshot.
+class ViewportMarkers(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(map, styles, iconFactory) {
+                var layer = L.layerGroup().addTo(map);
+                var icons = styles.map(iconFactory);
+                // marker id -> drawn L.marker
+                var drawn = {};
+                var latest = 0;
+
+                // point = [latitude, longitude, label, style, id]
+                function addMarker(point) {
+                    var marker = L.marker([point[0], point[1]], {icon: icons[point[3]]});
+                    marker.bindPopup(function() {
+                        var popup = document.createElement('div');
+                        popup.textContent = point[2];
+                        return popup;
+                    });
+                    layer.addLayer(marker);
+                    drawn[point[4]] = marker;
+                }
+
+                function update() {
+                    var request = ++latest;
+                    var bounds = map.getBounds().pad(0.25);
+                    var url = {{ this.url|tojson }} + '?bbox=' + [bounds.getSouth(), bounds.getWest(), bounds.getNorth(),
+                                                                 bounds.getEast()].join(',') + '&zoom=' + map.getZoom();
+                    fetch(url).then(function(response) {
+                        return response.json();
+                    }).then(function(points) {
+                        if (request !== latest) {
+                            return;
+                        }
+                        layer.clearLayers();
+                        drawn = {};
+                        points.forEach(addMarker);
+                    });
+                }
+
+                // event = {type: 'put', marker: point, styles: [...] if new styles were added}
+                //       | {type: 'remove', id: id} | {type: 'reload'}
+                new EventSource({{ this.events_url|tojson }}).onmessage = function(message) {
+                    var event = JSON.parse(message.data);
+                    if (event.type === 'reload') {
+                        window.location.reload();
+                        return;
+                    }
+                    if (event.styles) {
+                        icons = event.styles.map(iconFactory);
+                    }
+                    var id = event.type === 'put' ? event.marker[4] : event.id;
+                    if (drawn[id] !== undefined) {
+                        layer.removeLayer(drawn[id]);
+                        delete drawn[id];
+                    }
+                    if (event.type === 'put' && map.getBounds().pad(0.25).contains([event.marker[0], event.marker[1]])) {
+                        addMarker(event.marker);
+                    }
+                };
+
+                map.on('moveend', update);
+                update();
+                return layer;
+            })({{ this._parent.get_name() }}, {{ this.style_table.styles|tojson }}, {{ this.icon_factory }});
+        {% endmacro %}
+    """)
+
+    icon_factory = ICON_FACTORY
+
+    # `url` answers ?bbox=south,west,north,east&zoom=z with [[lat, lon, label, style, id], ...];
+    # `events_url` is the server-sent event stream of live edits
+    def __init__(self, url, events_url, style_table):
+        super().__init__()
+        self._name = 'ViewportMarkers'
+        self.url = url
+        self.events_url = events_url
+        self.style_table = style_table
+
+
+# Markers as one binary blob: a uint32 header length, a JSON header (count, column names,
+# distinct labels), padding to a multiple of 4 bytes and then one little-endian int32 array
+# per column:
+# latitude and longitude in units of 10^-COORDINATE_DECIMALS degrees, the style index into
+# `style_table` and the label index into the header's label list.
+def pack_markers(store, style_table):
+    scale = 10 ** COORDINATE_DECIMALS
+    columns = {
+        'latitude': np.round(store.latitudes * scale),
+        'longitude': np.round(store.longitudes * scale),
+        'style': style_table.codes(store),
+        'label': store.codes('Label'),
+    }
+    header = json.dumps({'count': len(store), 'columns': list(columns), 'labels': store.categories('Label')})
+    header = header.encode('utf-8')
+    # The arrays start on a 4-byte boundary so the browser can view them as Int32Arrays
+    parts = [len(header).to_bytes(4, 'little'), header, b'\0' * (-(4 + len(header)) % 4)]
+    parts.extend(np.ascontiguousarray(values, dtype='<i4').tobytes() for values in columns.values())
+    return b''.join(parts)
+
+
+# Shared table of the distinct (color, icon) pairs of a map. Markers refer to their pair by
+# index, so each icon is defined once in the page however many markers use it.
+class StyleTable:
+    def __init__(self):
+        self.styles = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.styles)
+
+    # Style index for every row of `store`, computed on the integer codes
+    def codes(self, store):
+        icon_count = len(store.categories('Icon'))
+        pairs = store.codes('Color').astype(np.int64) * icon_count + store.codes('Icon')
+        distinct, inverse = np.unique(pairs, return_inverse=True)
+        colors, icons = store.categories('Color'), store.categories('Icon')
+        styles = np.array([self.index(colors[pair // icon_count], icons[pair % icon_count])
+                           for pair in distinct.tolist()], dtype=np.int64)
+        return styles[inverse]
+
+    def index(self, color, icon):
+        key = (color, icon)
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.styles)
+            self.styles.append(key)
+        return index
+
+
+# Comma-separated GeoJSON point features for equally long coordinate, JSON label and style
+# index sequences
+def geojson_features(latitudes, longitudes, labels, styles):
+    return ','.join(
+        f'{{"type":"Feature","geometry":{{"type":"Point","coordinates":[{longitude},{latitude}]}},'
+        f'"properties":{{"label":{label},"style":{style}}}}}'
+        for latitude, longitude, label, style in zip(
+            np.round(latitudes, COORDINATE_DECIMALS).tolist(),
+            np.round(longitudes, COORDINATE_DECIMALS).tolist(),
+            labels.tolist(), styles.tolist()))
+
+
+# CSS color of every row of `store`: the sprite color of named colors, '#RRGGBB' as is
+def marker_colors(store):
+    colors = np.array([MARKER_COLORS.get(color, color) for color in store.categories('Color')], dtype=object)
+    return colors[store.codes('Color')]
+
+
+# Popup labels of every row of `store` as JSON string literals, escaping each distinct label once
+def json_labels(store):
+    labels = np.array([script_string(label) for label in store.categories('Label')], dtype=object)
+    return labels[store.codes('Label')]
+
+
+# JSON string literal of `text` that is safe inside a <script> block: like Jinja's tojson,
+# '<', '>' and '&' become \u escapes, so a label such as '</script>' cannot end the block
+def script_string(text):
+    return encode_basestring_ascii(text).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026')
+
+
+# Script element whose code is written to the page as is. branca turns rendered MacroElement
+# scripts into Jinja templates again, which is very slow for the multi-megabyte data blocks.
+class RawScript(Element):
+    def __init__(self, code):
+        super().__init__()
+        self.code = code
+
+    def render(self, **kwargs):
+        return self.code
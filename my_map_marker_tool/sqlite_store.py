@@ -0,0 +1,180 @@
+import os
+import sqlite3
+
+import numpy as np
+
+from marker_store import MarkerStore
+
+SQLITE_EXTENSIONS = ('.sqlite', '.db')
+# Rows fetched per cursor round trip when streaming markers out of the database
+BATCH_SIZE = 10000
+
+# Markers live in a plain table; the R*Tree virtual table indexes their positions and is
+# kept in sync by triggers, so every write path updates the index automatically.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS markers (
+    id INTEGER PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    label TEXT NOT NULL,
+    color TEXT NOT NULL,
+    icon TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS markers_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE TRIGGER IF NOT EXISTS markers_rtree_insert AFTER INSERT ON markers BEGIN
+    INSERT INTO markers_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+END;
+CREATE TRIGGER IF NOT EXISTS markers_rtree_update AFTER UPDATE OF latitude, longitude ON markers BEGIN
+    UPDATE markers_rtree SET min_lat = new.latitude, max_lat = new.latitude,
+                             min_lon = new.longitude, max_lon = new.longitude
+    WHERE id = new.id;
+END;
+CREATE TRIGGER IF NOT EXISTS markers_rtree_delete AFTER DELETE ON markers BEGIN
+    DELETE FROM markers_rtree WHERE id = old.id;
+END;
+"""
+
+_MARKER_COLUMNS = 'markers.id, markers.latitude, markers.longitude, markers.label, markers.color, markers.icon'
+
+
+def is_sqlite_project(file_path):
+    return os.path.splitext(file_path)[1].lower() in SQLITE_EXTENSIONS
+
+
+# SQLite-backed marker project for data sets that should not be held in memory.
+#
+# Reads come back as MarkerStore batches that keep the database ids as marker ids, so the
+# GUI can show a window of the project and write edits back by id. A connection belongs
+# to the thread that opened it; background jobs open their own SqliteProject.
+class SqliteProject:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._conn = sqlite3.connect(file_path)
+        self._conn.executescript(SCHEMA)
+
+    # Create a new database file holding the markers of `store`
+    @classmethod
+    def create(cls, file_path, store):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        project = cls(file_path)
+        project.add_store(store, keep_ids=True)
+        return project
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM markers').fetchone()[0]
+
+    def add(self, latitude, longitude, label, color, icon):
+        with self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO markers (latitude, longitude, label, color, icon) VALUES (?, ?, ?, ?, ?)',
+                (latitude, longitude, label, color, icon))
+        return cursor.lastrowid
+
+    # Insert every marker of a store in one transaction and return the ids they got
+    def add_store(self, store, keep_ids=False):
+        if keep_ids:
+            ids = store.ids.copy()
+        else:
+            start = self._conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM markers').fetchone()[0]
+            ids = np.arange(start, start + len(store), dtype=np.int64)
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO markers (id, latitude, longitude, label, color, icon) VALUES (?, ?, ?, ?, ?, ?)',
+                ((marker_id, *row) for marker_id, row in zip(ids.tolist(), store.iter_rows())))
+        return ids
+
+    def update(self, marker_id, latitude, longitude, label, color, icon):
+        with self._conn:
+            self._conn.execute(
+                'UPDATE markers SET latitude = ?, longitude = ?, label = ?, color = ?, icon = ? WHERE id = ?',
+                (latitude, longitude, label, color, icon, marker_id))
+
+    def delete(self, marker_id):
+        with self._conn:
+            self._conn.execute('DELETE FROM markers WHERE id = ?', (marker_id,))
+
+    # The first `limit` markers, e.g. to fill the list widget after opening a project
+    def head(self, limit):
+        return self._fetch_store(f'SELECT {_MARKER_COLUMNS} FROM markers ORDER BY id LIMIT ?', (limit,))
+
+    # Markers whose label, color or coordinates contain `query` (case-insensitive)
+    def search(self, query, limit):
+        pattern = f'%{query}%'
+        return self._fetch_store(
+            f'SELECT {_MARKER_COLUMNS} FROM markers '
+            'WHERE label LIKE ? OR color LIKE ? OR CAST(latitude AS TEXT) LIKE ? OR CAST(longitude AS TEXT) LIKE ? '
+            'ORDER BY id LIMIT ?',
+            (pattern, pattern, pattern, pattern, limit))
+
+    # Markers inside a lat/lon bounding box, found through the R*Tree index. With `cell` given
+    # as (latitude step, longitude step), only the lowest-id marker of every grid cell of that
+    # size is returned, so a zoomed-out view gets a thinned sample instead of every marker.
+    def in_bbox(self, south, west, north, east, limit=-1, cell=None):
+        columns, group_by, parameters = _MARKER_COLUMNS, '', []
+        if cell is not None:
+            # SQLite takes the other columns from the row MIN() picked
+            columns = _MARKER_COLUMNS.replace('markers.id', 'MIN(markers.id)', 1)
+            group_by = ('GROUP BY CAST((markers.latitude - ?) / ? AS INTEGER), '
+                        'CAST((markers.longitude - ?) / ? AS INTEGER) ')
+            parameters = [south, cell[0], west, cell[1]]
+        # The R*Tree stores 32-bit bounds rounded outwards, so re-check the exact coordinates
+        return self._fetch_store(
+            f'SELECT {columns} FROM markers_rtree JOIN markers ON markers.id = markers_rtree.id '
+            'WHERE markers_rtree.max_lat >= ? AND markers_rtree.min_lat <= ? '
+            'AND markers_rtree.max_lon >= ? AND markers_rtree.min_lon <= ? '
+            'AND markers.latitude BETWEEN ? AND ? AND markers.longitude BETWEEN ? AND ? '
+            f'{group_by}LIMIT ?',
+            (south, north, west, east, south, north, west, east, *parameters, limit))
+
+    # Distinct (color, icon) pairs of all markers
+    def styles(self):
+        return self._conn.execute('SELECT DISTINCT color, icon FROM markers').fetchall()
+
+    # Stream every marker as MarkerStore batches of at most `batch_size` rows
+    def iter_batches(self, batch_size=BATCH_SIZE):
+        cursor = self._conn.execute(f'SELECT {_MARKER_COLUMNS} FROM markers ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield _rows_to_store(rows)
+
+    # Write every marker to a CSV file, one batch at a time
+    def to_csv(self, file_path):
+        header = True
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            for batch in self.iter_batches():
+                batch.to_dataframe().to_csv(file, index=False, header=header)
+                header = False
+            if header:
+                MarkerStore().to_dataframe().to_csv(file, index=False)
+
+    # Copy the whole database to a new file, replacing any file there
+    def copy_to(self, file_path):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        target = sqlite3.connect(file_path)
+        try:
+            self._conn.backup(target)
+        finally:
+            target.close()
+
+    # Location of the first marker, used to center generated maps
+    def first_location(self):
+        row = self._conn.execute('SELECT latitude, longitude FROM markers ORDER BY id LIMIT 1').fetchone()
+        return list(row) if row else None
+
+    def _fetch_store(self, sql, parameters):
+        return _rows_to_store(self._conn.execute(sql, parameters).fetchall())
+
+
+def _rows_to_store(rows):
+    store = MarkerStore(capacity=len(rows))
+    if rows:
+        ids, latitudes, longitudes, labels, colors, icons = zip(*rows)
+        store.extend(latitudes, longitudes, labels, colors, icons, ids=ids)
+    return store
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from marker_store import COLUMNS, DEFAULT_ICON
+
+# Icons offered by the GUI; anything else is reported as unknown
+ICON_NAMES = ('info-sign', 'cloud', 'home', 'flag', 'star')
+# Colors folium.Icon can draw (folium.Icon.color_options); '#RRGGBB' codes are accepted too
+FOLIUM_COLORS = ('red', 'darkred', 'lightred', 'orange', 'beige', 'green', 'darkgreen', 'lightgreen', 'blue',
+                 'darkblue', 'cadetblue', 'lightblue', 'purple', 'darkpurple', 'pink', 'white', 'gray',
+                 'lightgray', 'black')
+HEX_COLOR_PATTERN = r'^#[0-9A-Fa-f]{6}$'
+
+# Explicit dtypes for reading marker files: everything is read as text first, so a bad
+# coordinate cell is reported instead of turning the whole column into `object`
+READ_DTYPES = {column: str for column in COLUMNS}
+NUMERIC_READ_DTYPES = {**READ_DTYPES, 'Latitude': np.float64, 'Longitude': np.float64}
+
+
+# Result of validating a frame of markers
+class ValidationReport:
+    def __init__(self, valid_frame, errors, total):
+        # Rows that passed every check, with Latitude/Longitude as float64
+        self.valid_frame = valid_frame
+        # One row per problem: Line (file line, header = line 1), Column, Value, Problem
+        self.errors = errors
+        self.total = total
+
+    @property
+    def ok(self):
+        return self.errors.empty
+
+    # Number of rows with at least one problem
+    @property
+    def rejected(self):
+        return self.errors['Line'].nunique()
+
+    # Positions in the validated frame of the rows that passed every check, e.g. to line up
+    # extra columns of the source file with `valid_frame`
+    def valid_rows(self, first_line=2):
+        rejected = self.errors['Line'].unique().astype(np.int64) - first_line
+        return np.setdiff1d(np.arange(self.total), rejected)
+
+    # Combine the problems of reports for consecutive chunks of one file
+    @classmethod
+    def merge(cls, reports):
+        errors = [report.errors for report in reports if not report.errors.empty]
+        errors = pd.concat(errors, ignore_index=True) if errors else _no_errors()
+        return cls(None, errors, sum(report.total for report in reports))
+
+    # Human readable summary listing the first `limit` problems
+    def summary(self, limit=10):
+        if self.ok:
+            return f"All {self.total} rows are valid"
+        lines = [f"{self.rejected} of {self.total} rows were skipped:"]
+        for error in self.errors.head(limit).itertuples(index=False):
+            value = '' if pd.isna(error.Value) else error.Value
+            lines.append(f"  line {error.Line}, {error.Column} '{value}': {error.Problem}")
+        if len(self.errors) > limit:
+            lines.append(f"  ... and {len(self.errors) - limit} more problems")
+        return "\n".join(lines)
+
+
+# Map the spreadsheet or CSV headers onto the marker columns, ignoring case
+# (Excel_formatting_lvl1.py writes lowercase 'latitude', 'color', 'icon' headers)
+def resolve_columns(headers):
+    lookup = {str(header).strip().lower(): header for header in headers}
+    resolved = {}
+    for column in COLUMNS:
+        if column.lower() in lookup:
+            resolved[column] = lookup[column.lower()]
+    missing = [column for column in COLUMNS if column not in resolved and column != 'Icon']
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    return resolved
+
+
+# Read a marker CSV with a fixed schema: only the marker columns, matched ignoring case like
+# spreadsheet imports (see resolve_columns), coordinates as float64 and the rest as text. If a
+# coordinate cell is not a number the file is read again with the coordinates as text, so
+# validate_markers can report the offending lines.
+def read_marker_csv(file_path):
+    resolved = resolve_columns(pd.read_csv(file_path, nrows=0).columns)
+    options = dict(usecols=list(resolved.values()), keep_default_na=False, na_values=[''])
+    numeric_dtypes = {source: NUMERIC_READ_DTYPES[column] for column, source in resolved.items()}
+    try:
+        frame = pd.read_csv(file_path, dtype=numeric_dtypes, **options)
+    except ValueError:
+        frame = pd.read_csv(file_path, dtype=dict.fromkeys(resolved.values(), str), **options)
+    return frame.rename(columns={source: column for column, source in resolved.items()})
+
+
+# Check every row of a frame in the marker column layout with column operations only.
+# `first_line` is the file line of the frame's first row (2 when the header is line 1); pass
+# the file line of every row as `lines` instead when the rows are not consecutive lines.
+def validate_markers(frame, first_line=2, lines=None):
+    frame = frame.reset_index(drop=True)
+    total = len(frame)
+    lines = np.arange(first_line, first_line + total) if lines is None else np.asarray(lines, dtype=np.int64)
+    if 'Icon' not in frame.columns:
+        frame = frame.assign(Icon=DEFAULT_ICON)
+    missing = [column for column in COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    latitudes, missing_lat, bad_lat = _coordinates(frame['Latitude'])
+    longitudes, missing_lon, bad_lon = _coordinates(frame['Longitude'])
+    labels = frame['Label']
+    # Colors and icons repeat a lot: check and normalize each distinct value once
+    color_codes, color_values = pd.factorize(frame['Color'], use_na_sentinel=True)
+    color_values = pd.Series(color_values, dtype=object).astype(str).str.strip()
+    is_hex = color_values.str.match(HEX_COLOR_PATTERN).to_numpy(dtype=bool)
+    # Named colors are stored in the lowercase spelling folium expects
+    color_values = color_values.where(is_hex, color_values.str.lower()).to_numpy(dtype=object)
+    known_color = is_hex | np.isin(color_values, FOLIUM_COLORS)
+    icon_codes, icon_values = pd.factorize(frame['Icon'].fillna(DEFAULT_ICON))
+    icon_values = np.asarray(icon_values, dtype=object)
+    known_icon = np.isin(icon_values, ICON_NAMES)
+
+    checks = [
+        ('Latitude', missing_lat, "missing latitude"),
+        ('Latitude', bad_lat, "latitude is not a number"),
+        ('Latitude', (latitudes < -90) | (latitudes > 90), "latitude must be between -90 and 90"),
+        ('Longitude', missing_lon, "missing longitude"),
+        ('Longitude', bad_lon, "longitude is not a number"),
+        ('Longitude', (longitudes < -180) | (longitudes > 180), "longitude must be between -180 and 180"),
+        ('Label', labels.isna().to_numpy(dtype=bool), "missing label"),
+        ('Color', color_codes < 0, "missing color"),
+        ('Color', (color_codes >= 0) & ~known_color[color_codes], "not a folium marker color or #RRGGBB code"),
+        ('Icon', ~known_icon[icon_codes], f"unknown icon (expected one of {', '.join(ICON_NAMES)})"),
+    ]
+
+    problems = []
+    bad = np.zeros(total, dtype=bool)
+    for column, mask, problem in checks:
+        if mask.any():
+            rows = np.flatnonzero(mask)
+            bad |= mask
+            problems.append(pd.DataFrame({
+                'Line': lines[rows],
+                'Column': column,
+                'Value': frame[column].to_numpy(dtype=object)[rows],
+                'Problem': problem,
+            }))
+    if problems:
+        errors = pd.concat(problems, ignore_index=True).sort_values('Line', kind='stable', ignore_index=True)
+    else:
+        errors = _no_errors()
+
+    valid = ~bad
+    valid_frame = pd.DataFrame({
+        'Latitude': latitudes[valid],
+        'Longitude': longitudes[valid],
+        'Label': labels[valid].astype(str).to_numpy(dtype=object),
+        'Color': color_values[color_codes[valid]],
+        'Icon': icon_values[icon_codes[valid]].astype(str),
+    }, columns=COLUMNS)
+    return ValidationReport(valid_frame, errors, total)
+
+
+# float64 values of a coordinate column plus masks of missing and non-numeric cells. Text
+# cells are parsed here; columns that are numeric already skip the parsing.
+def _coordinates(column):
+    missing = column.isna().to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(column):
+        values = column.to_numpy(dtype=np.float64)
+    else:
+        values = pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+    return values, missing, np.isnan(values) & ~missing
+
+
+def _no_errors():
+    return pd.DataFrame(columns=['Line', 'Column', 'Value', 'Problem'])
@@ -0,0 +1,255 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+from cluster_index import project
+
+# Zoom levels that get tiles; viewers scale the MAX_ZOOM tiles up beyond it
+MIN_ZOOM = 0
+MAX_ZOOM = 14
+# Tile coordinate space of the Mapbox Vector Tile spec
+EXTENT = 4096
+LAYER_NAME = 'markers'
+# Below MAX_ZOOM a tile keeps one marker per THIN_CELL x THIN_CELL square of its EXTENT
+# space (4 x 4 screen pixels), so no tile holds more than (EXTENT / THIN_CELL)^2 markers
+THIN_CELL = 64
+# File marking a folder written by write_tile_directory
+TILE_DIR_MARKER = '.map_marker_tiles'
+
+# Protocol buffer field keys (field number << 3 | wire type) of the vector tile messages
+_TILE_LAYERS = 0x1a
+_LAYER_NAME, _LAYER_FEATURES, _LAYER_KEYS, _LAYER_VALUES, _LAYER_EXTENT, _LAYER_VERSION = 0x0a, 0x12, 0x1a, 0x22, 0x28, 0x78
+_FEATURE_ID, _FEATURE_TAGS, _FEATURE_TYPE, _FEATURE_GEOMETRY = 0x08, 0x12, 0x18, 0x22
+_VALUE_STRING = 0x0a
+_POINT = 1
+# MoveTo command with a count of one, the whole geometry of a point feature
+_MOVE_TO_ONE = 1 | 1 << 3
+# Feature property keys; every feature tags both
+_KEYS = ('label', 'color')
+
+
+# Mapbox Vector Tiles of every marker of a store, one per non-empty tile and zoom level.
+#
+# Yields (zoom, tile_x, tile_y, tile bytes) in XYZ tile numbering. Each tile has one point
+# layer named LAYER_NAME whose features carry the marker id, its label and `colors[row]`, the
+# color to draw it in. Positions are projected once; per zoom level the markers are snapped
+# to the tile grid, thinned (see THIN_CELL) and grouped by tile, and the protobuf messages of
+# all features of the level are encoded at once with NumPy (see _pack_varints), so Python
+# only slices and joins bytes per tile.
+def vector_tiles(store, colors, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    x, y = project(store.latitudes, store.longitudes)
+    ids = np.asarray(store.ids, dtype=np.int64)
+    label_codes = store.codes('Label').astype(np.int64)
+    distinct_colors, color_codes = np.unique(np.asarray(colors, dtype=str), return_inverse=True)
+    # Layer value messages of every label and color, encoded once
+    label_values = _value_messages(store.categories('Label'))
+    color_values = _value_messages(distinct_colors.tolist())
+    layer_head = _bytes_field(_LAYER_NAME, LAYER_NAME.encode('ascii'))
+    layer_keys = b''.join(_bytes_field(_LAYER_KEYS, key.encode('ascii')) for key in _KEYS)
+    layer_tail = bytes([_LAYER_EXTENT]) + _varint(EXTENT) + bytes([_LAYER_VERSION, 2])
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        size = EXTENT * 2 ** zoom
+        pixel_x = np.clip((x * size).astype(np.int64), 0, size - 1)
+        pixel_y = np.clip((y * size).astype(np.int64), 0, size - 1)
+        rows = np.arange(len(store))
+        if zoom < max_zoom:
+            cells = size // THIN_CELL
+            _, rows = np.unique(pixel_x // THIN_CELL * cells + pixel_y // THIN_CELL, return_index=True)
+            rows.sort()
+        if len(rows) == 0:
+            continue
+
+        # Group the kept markers by tile
+        tiles = 2 ** zoom
+        keys = pixel_x[rows] // EXTENT * tiles + pixel_y[rows] // EXTENT
+        order = np.argsort(keys, kind='stable')
+        rows, keys = rows[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        tile_of_row = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(rows)]))
+
+        # Each tile has its own value table: its distinct labels followed by its distinct colors
+        label_entries, label_index, label_starts = _tile_values(tile_of_row, label_codes[rows], len(starts),
+                                                                len(label_values[0]))
+        color_entries, color_index, color_starts = _tile_values(tile_of_row, color_codes[rows], len(starts),
+                                                                len(color_values[0]))
+        label_count = np.diff(np.r_[label_starts, len(label_entries)])
+        color_index += label_count[tile_of_row]
+
+        tile_x, tile_y = keys // tiles, keys % tiles
+        features, feature_ends = _encode_features(ids[rows], pixel_x[rows] - tile_x * EXTENT,
+                                                  pixel_y[rows] - tile_y * EXTENT, label_index, color_index)
+        label_blob, label_ends = _join(label_values, label_entries)
+        color_blob, color_ends = _join(color_values, color_entries)
+        feature_ends, label_ends, color_ends = (np.r_[0, ends][np.r_[offsets, -1]].tolist() for ends, offsets in (
+            (feature_ends, starts), (label_ends, label_starts), (color_ends, color_starts)))
+
+        for tile, (tile_x, tile_y) in enumerate(zip(tile_x[starts].tolist(), tile_y[starts].tolist())):
+            layer = b''.join((layer_head, features[feature_ends[tile]:feature_ends[tile + 1]], layer_keys,
+                              label_blob[label_ends[tile]:label_ends[tile + 1]],
+                              color_blob[color_ends[tile]:color_ends[tile + 1]], layer_tail))
+            yield zoom, tile_x, tile_y, _bytes_field(_TILE_LAYERS, layer)
+
+
+# Write tiles as <directory>/<zoom>/<x>/<y>.pbf, replacing the zoom level folders of earlier
+# tiles written there. Returns the number of tiles written.
+#
+# Only folders this function wrote (marked with TILE_DIR_MARKER) or that hold nothing but zoom
+# level folders are cleared first; any other non-empty folder is refused, so picking e.g. the
+# home folder in Export Tiles cannot delete anything.
+def write_tile_directory(tiles, directory):
+    if os.path.isdir(directory):
+        names = os.listdir(directory)
+        zoom_dirs = [name for name in names if name.isdigit() and os.path.isdir(os.path.join(directory, name))]
+        if TILE_DIR_MARKER not in names and len(zoom_dirs) < len(names):
+            raise ValueError(f"{directory} is not empty; choose a new or empty folder for the tiles")
+        for name in zoom_dirs:
+            shutil.rmtree(os.path.join(directory, name))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, TILE_DIR_MARKER), 'w', encoding='utf-8') as file:
+        file.write("Vector tiles written by the map marker tool; the numbered folders are replaced on export.\n")
+    count = 0
+    for zoom, tile_x, tile_y, data in tiles:
+        tile_dir = os.path.join(directory, str(zoom), str(tile_x))
+        os.makedirs(tile_dir, exist_ok=True)
+        with open(os.path.join(tile_dir, f'{tile_y}.pbf'), 'wb') as file:
+            file.write(data)
+        count += 1
+    return count
+
+
+# Write tiles to an MBTiles 1.3 file (a SQLite database). Tile rows use the TMS numbering
+# of the spec (y grows northwards) and the tile data is gzip-compressed, as MBTiles readers
+# expect for vector tiles. Returns the number of tiles written.
+def write_mbtiles(tiles, file_path, name='Map markers', min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, bounds=None):
+    # Build into a temporary file so a cancelled export never leaves half a tileset behind
+    temp_path = file_path + '.tmp'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    count = 0
+    try:
+        connection.executescript("""
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+        """)
+        metadata = {
+            'name': name,
+            'format': 'pbf',
+            'type': 'overlay',
+            'minzoom': str(min_zoom),
+            'maxzoom': str(max_zoom),
+            'json': json.dumps({'vector_layers': [{'id': LAYER_NAME, 'minzoom': min_zoom, 'maxzoom': max_zoom,
+                                                   'fields': {key: 'String' for key in _KEYS}}]}),
+        }
+        if bounds is not None:
+            metadata['bounds'] = ','.join(str(value) for value in bounds)
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+        for zoom, tile_x, tile_y, data in tiles:
+            connection.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                               (zoom, tile_x, 2 ** zoom - 1 - tile_y, gzip.compress(data, compresslevel=6)))
+            count += 1
+        connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+        connection.commit()
+    except BaseException:
+        connection.close()
+        os.remove(temp_path)
+        raise
+    connection.close()
+    os.replace(temp_path, file_path)
+    return count
+
+
+# West, south, east, north of the markers of a store, as MBTiles metadata wants them
+def marker_bounds(store):
+    return (float(np.min(store.longitudes)), float(np.min(store.latitudes)),
+            float(np.max(store.longitudes)), float(np.max(store.latitudes)))
+
+
+# Distinct (tile, code) pairs of rows grouped by tile, in tile order. Returns the code of
+# every pair, each row's index into its tile's pairs and the first pair of every tile.
+def _tile_values(tile_of_row, codes, tile_count, code_count):
+    pairs, inverse = np.unique(tile_of_row * code_count + codes, return_inverse=True)
+    first = np.searchsorted(pairs // code_count, np.arange(tile_count))
+    return pairs % code_count, inverse - first[tile_of_row], first
+
+
+# Layer value messages (string values) as an object array of bytes plus their lengths
+def _value_messages(values):
+    messages = np.array([_bytes_field(_LAYER_VALUES, _bytes_field(_VALUE_STRING, str(value).encode('utf-8')))
+                         for value in values] or [b''], dtype=object)
+    return messages, np.array([len(message) for message in messages], dtype=np.int64)
+
+
+# Concatenate the messages of `codes`; returns the bytes and the end offset of every message
+def _join(value_messages, codes):
+    messages, lengths = value_messages
+    return b''.join(messages[codes].tolist()), np.cumsum(lengths[codes])
+
+
+# Layer feature fields of point features; returns the bytes of all features back to back and
+# the end offset of every feature
+def _encode_features(ids, tile_x, tile_y, label_index, color_index):
+    tile_x, tile_y = _zigzag(tile_x), _zigzag(tile_y)
+    tags_length = 2 + _varint_lengths(label_index) + _varint_lengths(color_index)
+    geometry_length = 1 + _varint_lengths(tile_x) + _varint_lengths(tile_y)
+    feature = [_FEATURE_ID, ids, _FEATURE_TAGS, tags_length, 0, label_index, 1, color_index,
+               _FEATURE_TYPE, _POINT, _FEATURE_GEOMETRY, geometry_length, _MOVE_TO_ONE, tile_x, tile_y]
+    feature_length = sum(1 if isinstance(part, int) else _varint_lengths(part) for part in feature)
+    return _pack_varints([_LAYER_FEATURES, feature_length] + feature, len(ids))
+
+
+# Encode `count` records, each the concatenation of `parts` as varints: a part is either one
+# byte shared by every record or an array with one value per record. Every byte position is
+# computed up front, so the output is filled with a few array operations per part.
+def _pack_varints(parts, count):
+    lengths = [None if isinstance(part, int) else _varint_lengths(part) for part in parts]
+    record_lengths = sum(1 if length is None else length for length in lengths)
+    ends = np.cumsum(record_lengths)
+    out = np.empty(int(ends[-1]) if count else 0, dtype=np.uint8)
+    offsets = ends - record_lengths
+    for part, length in zip(parts, lengths):
+        if length is None:
+            out[offsets] = part
+            offsets = offsets + 1
+            continue
+        for shift in range(int(length.max(initial=1))):
+            more = length > shift
+            values = (part[more] >> (7 * shift)) & 0x7f
+            out[offsets[more] + shift] = values | np.where(length[more] > shift + 1, 0x80, 0)
+        offsets = offsets + length
+    return out.tobytes(), ends
+
+
+def _varint_lengths(values):
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = np.asarray(values, dtype=np.int64) >> 7
+    while rest.any():
+        lengths += rest > 0
+        rest >>= 7
+    return lengths
+
+
+# Geometry coordinates are zigzag-encoded so small negative numbers stay small varints
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+
+def _varint(value):
+    if value < 0x80:
+        return bytes([value])
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _bytes_field(key, payload):
+    return bytes([key]) + _varint(len(payload)) + payload
@@ -0,0 +1,56 @@
+import numpy as np
+
+from cluster_index import TILE_SIZE, cell_keys, project
+
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+# Markers are thinned to one per THIN_PIXELS x THIN_PIXELS screen square at each zoom
+# level, so a viewport never gets many more markers than fit on the screen
+THIN_PIXELS = 32
+# From the first zoom level that keeps this share of the markers on, every marker is served
+DETAIL_FRACTION = 0.5
+# Upper bound on the markers returned for one viewport
+MAX_RESULTS = 5000
+
+
+# Spatial index answering "which markers to draw in this viewport at this zoom" queries.
+#
+# Per zoom level it keeps a thinned subset of the marker rows (one per THIN_PIXELS grid cell)
+# sorted by Web Mercator x, so a bounding box query is a binary search for the x range and a
+# mask over that slab for the y range. Levels stop at the first zoom that keeps
+# DETAIL_FRACTION of the markers; deeper zooms query all markers, whose slabs are narrow
+# there. The store is only read, so build the index from a snapshot.
+class ViewportIndex:
+    def __init__(self, store, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, thin_pixels=THIN_PIXELS,
+                 detail_fraction=DETAIL_FRACTION):
+        self.store = store
+        self.min_zoom = min_zoom
+        self.x, self.y = project(store.latitudes, store.longitudes)
+
+        # zoom -> (rows sorted by x, their x)
+        self._levels = {}
+        self.detail_zoom = max_zoom + 1
+        for zoom in range(min_zoom, max_zoom + 1):
+            cells = TILE_SIZE * 2 ** zoom / thin_pixels
+            _, rows = np.unique(cell_keys(self.x, self.y, cells), return_index=True)
+            if len(rows) >= detail_fraction * len(store):
+                self.detail_zoom = zoom
+                break
+            self._levels[zoom] = self._sorted(rows)
+        self._levels[self.detail_zoom] = self._sorted(np.arange(len(store)))
+
+    def __len__(self):
+        return len(self.x)
+
+    # Rows of the markers to draw inside the lat/lon box at `zoom`, at most `limit` of them
+    def query(self, south, west, north, east, zoom, limit=MAX_RESULTS):
+        zoom = min(max(int(zoom), self.min_zoom), self.detail_zoom)
+        rows, xs = self._levels[zoom]
+        (min_x, max_x), (max_y, min_y) = project([south, north], [max(west, -180), min(east, 180)])
+        slab = rows[np.searchsorted(xs, min_x, side='left'):np.searchsorted(xs, max_x, side='right')]
+        y = self.y[slab]
+        return slab[(y >= min_y) & (y <= max_y)][:limit]
+
+    def _sorted(self, rows):
+        rows = rows[np.argsort(self.x[rows], kind='stable')]
+        return rows, self.x[rows]
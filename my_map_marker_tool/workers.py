@@ -0,0 +1,124 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Raised inside a job function when the user pressed Cancel
+class JobCancelled(Exception):
+    pass
+
+
+# Handle passed to a running job so it can report progress and notice cancellation
+class Job:
+    def __init__(self, runner):
+        self._runner = runner
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    # Stop the job if Cancel was pressed; call this between units of work
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    # Queue a progress update; it is delivered to on_progress on the Tk thread
+    def report(self, *payload):
+        self._runner._events.put((self, 'progress', payload))
+
+
+# Job handle for calling job functions directly, outside a JobRunner (scripts, benchmarks):
+# progress reports are dropped and the job is only cancelled if cancel() is called
+class DetachedJob(Job):
+    def __init__(self):
+        super().__init__(None)
+
+    def report(self, *payload):
+        pass
+
+
+# Runs long operations on a single background thread and hands every result back to
+# the Tk thread by polling a queue with root.after.
+#
+# Job functions must not touch Tk widgets or the live marker store: they get their
+# inputs as arguments (e.g. a snapshot of the store) and return or report new data.
+# The on_done/on_progress callbacks run on the Tk thread, which stays the only writer.
+class JobRunner:
+    def __init__(self, root, poll_ms=50):
+        self._root = root
+        self._poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='map-marker-job')
+        self._events = queue.Queue()
+        self._callbacks = {}
+        self._current = None
+        self._polling = False
+
+    @property
+    def busy(self):
+        return self._current is not None
+
+    # Start `func(job, *args)` in the background. Callbacks run on the Tk thread:
+    # on_progress(*payload), on_done(result), on_error(exception), on_cancel().
+    def submit(self, func, *args, on_done=None, on_progress=None, on_error=None, on_cancel=None):
+        if self.busy:
+            raise RuntimeError("Another job is already running")
+        job = Job(self)
+        self._callbacks[job] = (on_done, on_progress, on_error, on_cancel)
+        self._current = job
+        self._executor.submit(self._run, job, func, args)
+        if not self._polling:
+            self._polling = True
+            self._root.after(self._poll_ms, self._poll)
+        return job
+
+    def cancel(self):
+        if self._current is not None:
+            self._current.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _run(self, job, func, args):
+        try:
+            result = func(job, *args)
+        except JobCancelled:
+            self._events.put((job, 'cancel', ()))
+        except Exception as e:
+            self._events.put((job, 'error', (e,)))
+        else:
+            self._events.put((job, 'done', (result,)))
+
+    def _poll(self):
+        while True:
+            try:
+                job, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(job, kind, payload)
+        if self._current is None and self._events.empty():
+            self._polling = False
+        else:
+            self._root.after(self._poll_ms, self._poll)
+
+    def _dispatch(self, job, kind, payload):
+        on_done, on_progress, on_error, on_cancel = self._callbacks.get(job, (None, None, None, None))
+        if kind == 'progress':
+            if on_progress is not None and not job.cancelled:
+                on_progress(*payload)
+            return
+
+        # The job has finished one way or another
+        del self._callbacks[job]
+        if self._current is job:
+            self._current = None
+        if kind == 'done' and on_done is not None:
+            on_done(*payload)
+        elif kind == 'error' and on_error is not None:
+            on_error(*payload)
+        elif kind == 'cancel' and on_cancel is not None:
+            on_cancel()